@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from gallery import calibrate_temperature, l2_normalize, top_k_proba
+
+ANN_INDEX_DIR = "ann_index"
+ANN_FORMAT_VERSION = 1
+
+def _squared_distances(X: np.ndarray, C: np.ndarray) -> np.ndarray:
+    """Squared L2 distance between every row of X and every row of C"""
+    return (np.einsum('ij,ij->i', X, X)[:, None]
+            - 2.0 * (X @ C.T)
+            + np.einsum('ij,ij->i', C, C)[None, :])
+
+def kmeans(X: np.ndarray, k: int, n_iter: int = 20, seed: int = 42) -> np.ndarray:
+    """Plain Lloyd's k-means in NumPy, returning float32 centroids"""
+    rng = np.random.default_rng(seed)
+    X = np.asarray(X, dtype=np.float32)
+    k = min(k, len(X))
+    centroids = X[rng.choice(len(X), size=k, replace=False)].copy()
+    
+    for _ in range(n_iter):
+        assignment = np.argmin(_squared_distances(X, centroids), axis=1)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, X)
+        
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = X[rng.choice(len(X), size=int(empty.sum()), replace=False)]
+    
+    return centroids
+
+class IVFPQIndex:
+    """Approximate nearest-neighbour index over face embeddings (IVF + PQ)
+    
+    Vectors are L2-normalised and assigned to the nearest of n_lists coarse
+    k-means centroids. The residual to that centroid is product-quantised into
+    n_subvectors one-byte codes. A search probes the n_probe closest lists and
+    ranks their members with asymmetric distance tables, so per-query cost
+    grows with the probed list sizes rather than with the whole gallery.
+    
+    Like GalleryMatcher it exposes classes_ and predict_proba, so it can be
+    used as a recognition engine in predict_face. Rows are keyed by student
+    id for add_student/remove_student, and save/load use plain .npy files
+    that can be opened with mmap_mode='r'.
+    """
+    
+    def __init__(self, dim: int, n_lists: int = 64, n_subvectors: int = 64, n_probe: int = 8,
+                 top_k: int = 5, temperature: float = 0.02):
+        if dim % n_subvectors:
+            raise ValueError(f"dim {dim} is not divisible by n_subvectors {n_subvectors}")
+        
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_subvectors = n_subvectors
+        self.n_probe = n_probe
+        self.top_k = top_k
+        self.temperature = temperature
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+        self.list_terms: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self._set_rows(np.zeros((0, n_subvectors), dtype=np.uint8),
+                       np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32))
+    
+    @property
+    def sub_dim(self) -> int:
+        return self.dim // self.n_subvectors
+    
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+    
+    @property
+    def classes_(self) -> np.ndarray:
+        return self._state[5]
+    
+    def __len__(self) -> int:
+        return len(self._state[1])
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def build(cls, X: np.ndarray, y: np.ndarray, n_lists: Optional[int] = None,
+              **kwargs) -> "IVFPQIndex":
+        """Train the quantisers on X and add every row with its student id"""
+        X = l2_normalize(X)
+        if 'temperature' not in kwargs:
+            kwargs['temperature'] = calibrate_temperature(X, y) or 0.02
+        if n_lists is None:
+            n_lists = int(np.clip(np.sqrt(len(X)), 1, 1024))
+        
+        if 'n_subvectors' not in kwargs:
+            kwargs['n_subvectors'] = max(d for d in range(1, 65) if X.shape[1] % d == 0)
+        
+        index = cls(X.shape[1], n_lists=n_lists, **kwargs)
+        index.train(X)
+        index.add(X, y)
+        return index
+    
+    def train(self, X: np.ndarray, max_samples: int = 50000, max_pq_samples: int = 8192, seed: int = 42):
+        """Fit the coarse centroids and the per-subspace PQ codebooks"""
+        X = l2_normalize(X)
+        rng = np.random.default_rng(seed)
+        if len(X) > max_samples:
+            X = X[rng.choice(len(X), size=max_samples, replace=False)]
+        
+        self.centroids = kmeans(X, self.n_lists, seed=seed)
+        self.n_lists = len(self.centroids)
+        if len(X) > max_pq_samples:
+            X = X[rng.choice(len(X), size=max_pq_samples, replace=False)]
+        residuals = X - self.centroids[self._assign(X)]
+        
+        ksub = min(256, len(X))
+        codebooks = np.zeros((self.n_subvectors, ksub, self.sub_dim), dtype=np.float32)
+        for j in range(self.n_subvectors):
+            part = residuals[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            centroids = kmeans(part, ksub, n_iter=10, seed=seed + j)
+            codebooks[j, :len(centroids)] = centroids
+        self.codebooks = codebooks
+        self.list_terms = self._list_terms()
+    
+    def _list_terms(self) -> np.ndarray:
+        """Per-list part of the ADC table: ||p||^2 + 2<c, p> for every code p
+        
+        With a query q, coarse centroid c and codeword p in each subspace,
+        ||q - c - p||^2 = ||q - c||^2 + sum(||p||^2 + 2<c, p> - 2<q, p>), so
+        only the last term has to be computed per query.
+        """
+        norms = np.einsum('mkd,mkd->mk', self.codebooks, self.codebooks)
+        parts = self.centroids.reshape(self.n_lists, self.n_subvectors, self.sub_dim)
+        return (norms[None, :, :]
+                + 2.0 * np.einsum('lmd,mkd->lmk', parts, self.codebooks)).astype(np.float32)
+    
+    def _assign(self, X: np.ndarray) -> np.ndarray:
+        return np.argmin(_squared_distances(X, self.centroids), axis=1).astype(np.int32)
+    
+    def _encode(self, X: np.ndarray, list_ids: np.ndarray) -> np.ndarray:
+        residuals = X - self.centroids[list_ids]
+        codes = np.zeros((len(X), self.n_subvectors), dtype=np.uint8)
+        for j in range(self.n_subvectors):
+            part = residuals[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            codes[:, j] = np.argmin(_squared_distances(part, self.codebooks[j]), axis=1)
+        return codes
+    
+    def _set_rows(self, codes: np.ndarray, labels: np.ndarray, list_ids: np.ndarray):
+        order = np.argsort(list_ids, kind='stable')
+        offsets = np.searchsorted(list_ids[order], np.arange(self.n_lists + 1))
+        classes, label_index = np.unique(labels, return_inverse=True)
+        self._state = (codes, labels, list_ids, order, offsets, classes, label_index)
+    
+    def add(self, X: np.ndarray, y: np.ndarray):
+        """Quantise and insert rows labelled with student ids"""
+        if not self.is_trained:
+            raise RuntimeError("Index must be trained before adding vectors")
+        
+        X = l2_normalize(X)
+        list_ids = self._assign(X)
+        new_codes = self._encode(X, list_ids)
+        with self._lock:
+            codes, labels, old_lists = self._state[:3]
+            self._set_rows(np.concatenate([codes, new_codes]),
+                           np.concatenate([labels, np.asarray(y, dtype=np.int64)]),
+                           np.concatenate([old_lists, list_ids]))
+    
+    def add_student(self, student_id: int, embeddings: np.ndarray):
+        """Insert (or extend) one student's embeddings"""
+        embeddings = l2_normalize(embeddings)
+        self.add(embeddings, np.full(len(embeddings), int(student_id), dtype=np.int64))
+    
+    def remove_student(self, student_id: int) -> int:
+        """Delete all rows of one student; returns the number removed"""
+        with self._lock:
+            codes, labels, list_ids = self._state[:3]
+            keep = labels != int(student_id)
+            removed = int(len(labels) - keep.sum())
+            if removed:
+                self._set_rows(codes[keep], labels[keep], list_ids[keep])
+        return removed
+    
+    def search(self, query: np.ndarray, k: int = 10,
+               n_probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (similarities, row positions) of the approximate top-k rows"""
+        return self._search(l2_normalize(query)[0], k, n_probe, self._state)
+    
+    def _search(self, q: np.ndarray, k: int, n_probe: Optional[int],
+                state: tuple) -> Tuple[np.ndarray, np.ndarray]:
+        codes, _, _, order, offsets = state[:5]
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        
+        coarse = _squared_distances(q[None, :], self.centroids)[0]
+        if n_probe < self.n_lists:
+            probes = np.argpartition(coarse, n_probe - 1)[:n_probe]
+        else:
+            probes = np.arange(self.n_lists)
+        
+        query_terms = -2.0 * np.einsum('md,mkd->mk', q.reshape(self.n_subvectors, self.sub_dim),
+                                       self.codebooks)
+        sub = np.arange(self.n_subvectors)
+        rows = []
+        dists = []
+        for list_id in probes:
+            members = order[offsets[list_id]:offsets[list_id + 1]]
+            if len(members) == 0:
+                continue
+            
+            table = self.list_terms[list_id] + query_terms
+            rows.append(members)
+            dists.append(coarse[list_id] + table[sub, codes[members]].sum(axis=1))
+        
+        if not rows:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        
+        rows = np.concatenate(rows)
+        dists = np.concatenate(dists)
+        k = min(k, len(rows))
+        top = np.argpartition(dists, k - 1)[:k]
+        top = top[np.argsort(dists[top])]
+        return (1.0 - dists[top] / 2.0).astype(np.float32), rows[top]
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Softmax over each student's best top-k similarity, in classes_ order"""
+        state = self._state
+        classes, label_index = state[5], state[6]
+        queries = l2_normalize(X)
+        proba = np.zeros((len(queries), len(classes)), dtype=np.float64)
+        
+        for i, q in enumerate(queries):
+            scores, rows = self._search(q, self.top_k, None, state)
+            if len(rows):
+                proba[i] = top_k_proba(scores[None, :], label_index[rows][None, :],
+                                       len(classes), self.temperature)[0]
+        return proba
+    
+    def to_arrays(self) -> Tuple[dict, Dict[str, np.ndarray]]:
+        """Split the index into JSON-able params and NumPy arrays"""
+        codes, labels, list_ids = self._state[:3]
+        params = {'dim': self.dim, 'n_lists': self.n_lists, 'n_subvectors': self.n_subvectors,
+                  'n_probe': self.n_probe, 'top_k': self.top_k, 'temperature': self.temperature}
+        arrays = {'centroids': self.centroids, 'codebooks': self.codebooks,
+                  'list_terms': self.list_terms, 'codes': codes, 'labels': labels,
+                  'list_ids': list_ids}
+        return params, arrays
+    
+    @classmethod
+    def from_arrays(cls, params: dict, arrays: Dict[str, np.ndarray]) -> "IVFPQIndex":
+        """Rebuild an index around existing (possibly memory-mapped) arrays"""
+        index = cls(params['dim'], n_lists=params['n_lists'], n_subvectors=params['n_subvectors'],
+                    n_probe=params['n_probe'], top_k=params['top_k'],
+                    temperature=params['temperature'])
+        index.centroids = arrays['centroids']
+        index.codebooks = arrays['codebooks']
+        index.list_terms = arrays['list_terms']
+        index._set_rows(arrays['codes'], arrays['labels'], arrays['list_ids'])
+        return index
+    
+    def save(self, directory: str = ANN_INDEX_DIR):
+        """Write the index as .npy arrays plus a JSON manifest"""
+        os.makedirs(directory, exist_ok=True)
+        params, arrays = self.to_arrays()
+        for name, array in arrays.items():
+            tmp_path = os.path.join(directory, f"{name}.tmp.npy")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+        
+        manifest = dict(params, version=ANN_FORMAT_VERSION)
+        tmp_path = os.path.join(directory, "manifest.json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(directory, "manifest.json"))
+    
+    @classmethod
+    def load(cls, directory: str = ANN_INDEX_DIR, mmap_mode: Optional[str] = 'r') -> "IVFPQIndex":
+        """Open a saved index, memory-mapping its arrays by default"""
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest['version'] != ANN_FORMAT_VERSION:
+            raise ValueError(f"Unsupported ANN index version: {manifest['version']}")
+        
+        names = ('centroids', 'codebooks', 'list_terms', 'codes', 'labels', 'list_ids')
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in names}
+        return cls.from_arrays(manifest, arrays)
+
+def recall_report(index: IVFPQIndex, X: np.ndarray, queries: np.ndarray, k: int = 10,
+                  n_probes: Tuple[int, ...] = (1, 2, 4, 8, 16, 32)) -> List[Dict]:
+    """Compare recall@k and latency of the index against exact search
+    
+    X must be the vectors the index was built from, in insertion order.
+    """
+    base = l2_normalize(X)
+    queries = l2_normalize(queries)
+    
+    start = time.perf_counter()
+    exact = np.argsort(-(queries @ base.T), axis=1)[:, :k]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    
+    report = []
+    for n_probe in n_probes:
+        if n_probe > index.n_lists:
+            break
+        
+        hits = 0
+        start = time.perf_counter()
+        for i, q in enumerate(queries):
+            _, rows = index.search(q, k, n_probe=n_probe)
+            hits += len(np.intersect1d(rows, exact[i]))
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        
+        report.append({'n_probe': n_probe, 'recall_at_k': hits / (k * len(queries)),
+                       'latency_ms': latency_ms, 'exact_latency_ms': exact_ms})
+    return report
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Recall@k vs latency of the IVF-PQ index against exact search")
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=4096)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dataset", action="store_true",
+                        help="use the face crops in the training embedding cache instead of synthetic vectors")
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(0)
+    if args.dataset:
+        from embedding_cache import EmbeddingCache
+        
+        with np.load(EmbeddingCache.load().path) as data:
+            X = data['features'][data['has_face']].astype(np.float32) / 255.0
+            y = data['labels'][data['has_face']]
+        picks = rng.choice(len(X), size=min(args.queries, len(X)), replace=False)
+        queries = X[picks] + 0.02 * rng.normal(size=(len(picks), X.shape[1])).astype(np.float32)
+    else:
+        n_students = max(1, args.vectors // 10)
+        identities = rng.normal(size=(n_students, args.dim)).astype(np.float32)
+        y = np.repeat(np.arange(n_students), 10)[:args.vectors]
+        X = identities[y] + 0.5 * rng.normal(size=(len(y), args.dim)).astype(np.float32)
+        queries = identities[rng.integers(0, n_students, args.queries)] + \
+            0.5 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    
+    start = time.perf_counter()
+    index = IVFPQIndex.build(X, y)
+    print(f"Built {len(index)} vectors in {len(index.centroids)} lists in {time.perf_counter() - start:.1f}s")
+    print(json.dumps(recall_report(index, X, queries, k=args.k), indent=2))
@@ -0,0 +1,311 @@
+import os
+import re
+import json
+import base64
+import asyncio
+import binascii
+import multiprocessing
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from typing import Callable, Dict, List, Optional, Tuple
+
+from database import init_database, add_student, get_student_by_id, delete_student, attendance_writer_stats
+from face_recognition_model import (
+    enroll_face_image, add_student_to_gallery, is_model_trained, delete_student_images,
+    extract_face_embedding, face_detector, load_model, classify_embedding, prediction_batcher
+)
+from training_jobs import training_manager
+import latency_metrics
+
+API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("API_PORT", 5000))
+API_WORKERS = int(os.environ.get("API_WORKERS", os.cpu_count() or 1))
+MAX_BODY_BYTES = 32 * 1024 * 1024
+KEEPALIVE_TIMEOUT = 15.0
+
+class APIError(Exception):
+    """An error reported to the client as {"success": false, "error": message}"""
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def decode_image_payload(value) -> bytes:
+    """Bytes of an image sent as a data URI or bare base64 string"""
+    if not isinstance(value, str) or not value:
+        raise APIError(400, "Image must be a base64 string or data URI")
+    if value.startswith("data:"):
+        value = value.partition(",")[2]
+    try:
+        return base64.b64decode(value, validate=True)
+    except binascii.Error:
+        raise APIError(400, "Image is not valid base64")
+
+def _decode_image(data: bytes) -> Optional[np.ndarray]:
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def _init_api_worker():
+    """Warm up a detector once per worker process"""
+    cv2.setNumThreads(1)
+    with face_detector():
+        pass
+
+def _run_with_metrics(fn, *args):
+    """Call fn in a worker and return its result with the latency samples it recorded"""
+    return fn(*args), latency_metrics.drain()
+
+def _ping_worker() -> int:
+    return os.getpid()
+
+def _enroll_image(student_id: int, data: bytes, image_index: int) -> Optional[np.ndarray]:
+    """Store one registration image and return its embedding, or None without a face (runs in a worker)"""
+    image = _decode_image(data)
+    if image is None:
+        return None
+    return enroll_face_image(student_id, image, image_index)
+
+def _embed_image(data: bytes) -> Optional[np.ndarray]:
+    """Detect and embed the face in an encoded image (runs in a worker)"""
+    image = _decode_image(data)
+    if image is None:
+        return None
+    return extract_face_embedding(image)
+
+class FaceAPIServer:
+    """Asynchronous HTTP API for kiosks: registration, training and recognition
+    
+    Connections are served by one asyncio loop with HTTP/1.1 keep-alive.
+    Face detection runs in a pool of worker processes that each keep a warm
+    detector, so concurrent kiosks are processed in parallel. Each worker
+    sends the latency samples of its call back with the result, so
+    /api/stats covers the detection stages too. The resulting
+    embeddings are classified here by the shared prediction batcher against
+    the memory-mapped model (reloaded when a new version is published).
+    Database and file operations run in threads, and training runs as a
+    background job whose progress is polled via /api/train/status.
+    """
+    
+    def __init__(self, workers: int = API_WORKERS):
+        self.workers = max(1, workers)
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.training = training_manager()
+        self.requests = 0
+        self.routes: List[Tuple[str, re.Pattern, Callable]] = [
+            ('POST', re.compile(r'/api/register'), self.register),
+            ('POST', re.compile(r'/api/train'), self.start_training),
+            ('GET', re.compile(r'/api/train/status'), self.training_status),
+            ('POST', re.compile(r'/api/train/cancel'), self.cancel_training),
+            ('POST', re.compile(r'/api/predict'), self.predict),
+            ('DELETE', re.compile(r'/api/students/(\d+)'), self.delete),
+            ('GET', re.compile(r'/api/stats'), self.stats),
+        ]
+    
+    async def start(self, host: str = API_HOST, port: int = API_PORT) -> asyncio.AbstractServer:
+        """Start the worker pool, warm every worker and begin listening"""
+        init_database()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_api_worker)
+        await asyncio.to_thread(load_model)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, _ping_worker) for _ in range(self.workers)))
+        return await asyncio.start_server(self.handle_connection, host, port)
+    
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+    
+    async def run_in_pool(self, fn, *args):
+        result, samples = await asyncio.get_running_loop().run_in_executor(self.pool, _run_with_metrics, fn, *args)
+        latency_metrics.merge(samples)
+        return result
+    
+    async def register(self, body: dict) -> dict:
+        name = str(body.get('name') or '').strip()
+        if not name:
+            raise APIError(400, "Student name is required")
+        images = body.get('images') or []
+        if not isinstance(images, list) or not images:
+            raise APIError(400, "At least one image is required")
+        blobs = [decode_image_payload(image) for image in images]
+        
+        student_id = await asyncio.to_thread(
+            add_student, name, str(body.get('roll_number') or ''), str(body.get('class_name') or ''),
+            str(body.get('section') or ''), str(body.get('registration_number') or '')
+        )
+        enrolled = await asyncio.gather(*(self.run_in_pool(_enroll_image, student_id, blob, idx)
+                                          for idx, blob in enumerate(blobs)))
+        embeddings = [embedding for embedding in enrolled if embedding is not None]
+        
+        if not embeddings:
+            await asyncio.to_thread(delete_student, student_id)
+            await asyncio.to_thread(delete_student_images, student_id)
+            return {'success': False, 'error': "No face detected in the submitted images"}
+        
+        recognizable = await asyncio.to_thread(add_student_to_gallery, student_id, embeddings)
+        return {'success': True, 'student_id': student_id, 'valid_images': len(embeddings),
+                'total_images': len(blobs), 'recognizable': recognizable}
+    
+    async def start_training(self, body: dict) -> dict:
+        job_id = await asyncio.to_thread(self.training.start, body.get('engine'), body.get('projection'))
+        if job_id is None:
+            return {'success': False, 'error': "Training is already running",
+                    'job_id': self.training.status().get('job_id')}
+        return {'success': True, 'message': "Training started", 'job_id': job_id}
+    
+    async def training_status(self, body: dict) -> dict:
+        status = await asyncio.to_thread(self.training.status)
+        status['model_trained'] = await asyncio.to_thread(is_model_trained)
+        return status
+    
+    async def cancel_training(self, body: dict) -> dict:
+        if not await asyncio.to_thread(self.training.cancel, body.get('job_id')):
+            return {'success': False, 'error': "No matching training job is running"}
+        return {'success': True, 'message': "Cancellation requested"}
+    
+    async def predict(self, body: dict) -> dict:
+        data = decode_image_payload(body.get('image'))
+        if not await asyncio.to_thread(is_model_trained):
+            return {'success': False, 'error': "Model is not trained"}
+        
+        embedding = await self.run_in_pool(_embed_image, data)
+        student_id, confidence = None, 0.0
+        if embedding is not None:
+            student_id, confidence = await asyncio.wrap_future(classify_embedding(embedding))
+        student = await asyncio.to_thread(get_student_by_id, student_id) if student_id is not None else None
+        return {
+            'success': True,
+            'recognized': student is not None,
+            'student_id': student['id'] if student else None,
+            'name': student['name'] if student else None,
+            'confidence': confidence,
+        }
+    
+    async def delete(self, body: dict, student_id: str) -> dict:
+        student_id = int(student_id)
+        if await asyncio.to_thread(get_student_by_id, student_id) is None:
+            raise APIError(404, f"Student {student_id} not found")
+        
+        await asyncio.to_thread(delete_student, student_id)
+        await asyncio.to_thread(delete_student_images, student_id)
+        return {'success': True, 'student_id': student_id}
+    
+    async def stats(self, body: dict) -> dict:
+        return {'requests': self.requests, 'workers': self.workers,
+                'prediction_batcher': prediction_batcher().stats(),
+                'attendance_writer': attendance_writer_stats(),
+                'latency': latency_metrics.snapshot()}
+    
+    async def dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, dict]:
+        """Route a request to its handler; returns (status, JSON payload)"""
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(path)
+            if match is None:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            
+            try:
+                payload = json.loads(body) if body else {}
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                return 400, {'success': False, 'error': "Request body is not valid JSON"}
+            if not isinstance(payload, dict):
+                return 400, {'success': False, 'error': "Request body must be a JSON object"}
+            
+            try:
+                return 200, await handler(payload, *match.groups())
+            except APIError as e:
+                return e.status, {'success': False, 'error': e.message}
+            except Exception as e:
+                return 500, {'success': False, 'error': str(e)}
+        
+        if allowed:
+            return 405, {'success': False, 'error': f"Method {method} not allowed"}
+        return 404, {'success': False, 'error': f"No route for {path}"}
+    
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve HTTP/1.1 requests on one connection until it closes"""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                
+                parts = request_line.decode('latin-1').split()
+                headers = await self._read_headers(reader)
+                if len(parts) != 3:
+                    await self._respond(writer, 400, {'success': False, 'error': "Malformed request line"}, False)
+                    break
+                method, target, version = parts
+                
+                if 'transfer-encoding' in headers:
+                    await self._respond(writer, 501, {'success': False, 'error': "Transfer-Encoding is not supported"}, False)
+                    break
+                content_length = headers.get('content-length') or '0'
+                if not re.fullmatch(r'[0-9]+', content_length):
+                    await self._respond(writer, 400, {'success': False, 'error': "Malformed Content-Length"}, False)
+                    break
+                length = int(content_length)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'success': False, 'error': "Request body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+                
+                self.requests += 1
+                status, payload = await self.dispatch(method.upper(), target.split('?', 1)[0], body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _read_headers(self, reader: asyncio.StreamReader) -> Dict[str, str]:
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+    
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+async def serve(host: str = API_HOST, port: int = API_PORT, workers: int = API_WORKERS):
+    """Run the API server until cancelled"""
+    api = FaceAPIServer(workers)
+    server = await api.start(host, port)
+    print(f"Face recognition API listening on http://{host}:{port} with {api.workers} workers", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        api.close()
+
+def main():
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
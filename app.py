@@ -6,6 +6,7 @@ import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
 import os
+import json
 import time
 from datetime import datetime, timedelta
 
@@ -16,9 +17,14 @@ from database import (
     bulk_import_students, get_class_wise_attendance, get_student_attendance_summary
 )
 from face_recognition_model import (
-    save_face_image, train_model, predict_face, is_model_trained,
-    delete_student_images, extract_face_embedding
+    save_face_image, enroll_face_image, add_student_to_gallery, is_model_trained,
+    delete_student_images, recognize_tracked_faces
 )
+from face_tracker import FaceTracker
+from enrollment_capture import EnrollmentGate, capture_enrollment
+from camera_pipeline import CameraPipeline, DISPLAY_FPS
+from training_jobs import training_manager
+import latency_metrics
 
 st.set_page_config(
     page_title="Face Recognition Attendance System",
@@ -252,6 +258,55 @@ def home_page():
             st.session_state.page = "records"
             st.rerun()
 
+ENROLLMENT_REASONS = {
+    'accepted': "✅ Good frame",
+    'no_face': "🙈 No face detected",
+    'too_small': "↔️ Move closer to the camera",
+    'blurry': "🌫️ Too blurry, hold still",
+    'duplicate': "🔄 Same as an earlier frame, turn your head slightly",
+}
+
+def stream_enrollment_capture(num_images=10):
+    """Capture frames until num_images sharp, distinct face frames are collected"""
+    cap = cv2.VideoCapture(0)
+    
+    camera_placeholder = st.empty()
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    
+    if not cap.isOpened():
+        st.error("Could not access camera. Please check your webcam connection.")
+        return []
+    
+    gate = EnrollmentGate(target=num_images)
+    
+    def read_frame():
+        ret, frame = cap.read()
+        return frame if ret else None
+    
+    def show(image, accepted, verdict):
+        display_frame = image.copy()
+        if accepted is not None:
+            x1, y1, x2, y2 = accepted.bbox
+            cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        camera_placeholder.image(cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB), channels="RGB",
+                                 use_container_width=True)
+        progress_bar.progress(len(gate.accepted) / num_images)
+        status_text.text(f"Captured {len(gate.accepted)}/{num_images} images - {ENROLLMENT_REASONS[verdict]}")
+    
+    st.info(f"📸 Capturing {num_images} images. Please look at the camera and turn your head slowly.")
+    try:
+        frames = capture_enrollment(read_frame, gate, on_frame=show)
+    finally:
+        cap.release()
+        camera_placeholder.empty()
+        progress_bar.empty()
+        status_text.empty()
+    
+    if not gate.done:
+        st.warning(f"⏱️ Only {len(frames)} good frames were captured in time ({gate.frames} frames checked).")
+    return frames
+
 def register_student_page():
     """Student registration page"""
     st.markdown('<h1 class="big-title">➕ Register New Student</h1>', unsafe_allow_html=True)
@@ -273,6 +328,7 @@ def register_student_page():
         st.info("Click 'Capture Photos' to take 10 photos for training. Please look at the camera and move slightly between captures.")
         
         num_photos = st.slider("Number of photos to capture", 5, 15, 10)
+        streaming = st.checkbox("Keep only sharp, distinct frames and stop when enough are captured", value=True)
         
         submitted = st.form_submit_button("🚀 Register Student", use_container_width=True)
     
@@ -282,7 +338,11 @@ def register_student_page():
             return
         
         with st.spinner("📸 Starting camera..."):
-            images = capture_from_camera(num_photos)
+            if streaming:
+                frames = stream_enrollment_capture(num_photos)
+                images = [frame.image for frame in frames]
+            else:
+                images = capture_from_camera(num_photos)
         
         if len(images) == 0:
             st.error("❌ Failed to capture images. Please check your camera.")
@@ -291,12 +351,17 @@ def register_student_page():
         with st.spinner("💾 Saving student information..."):
             student_id = add_student(name, roll_number, class_name, section, registration_number)
             
-            valid_images = 0
-            for idx, img in enumerate(images):
-                embedding = extract_face_embedding(img)
-                if embedding is not None:
-                    save_face_image(student_id, img, idx)
-                    valid_images += 1
+            embeddings = []
+            if streaming:
+                for idx, frame in enumerate(frames):
+                    save_face_image(student_id, frame.image, idx, face=frame.face, bbox=frame.bbox)
+                    embeddings.append(frame.embedding)
+            else:
+                for idx, img in enumerate(images):
+                    embedding = enroll_face_image(student_id, img, idx)
+                    if embedding is not None:
+                        embeddings.append(embedding)
+            valid_images = len(embeddings)
             
             if valid_images == 0:
                 delete_student(student_id)
@@ -312,7 +377,10 @@ def register_student_page():
                 </div>
             """, unsafe_allow_html=True)
             
-            st.warning("⚠️ Please train the model from the sidebar to enable face recognition for this student.")
+            if add_student_to_gallery(student_id, embeddings):
+                st.info("🔎 The student can be recognized right away.")
+            else:
+                st.warning("⚠️ Please train the model from the sidebar to enable face recognition for this student.")
 
 def mark_attendance_page():
     """Mark attendance page"""
@@ -333,53 +401,149 @@ def mark_attendance_page():
         </div>
     """, unsafe_allow_html=True)
     
+    mode = st.radio("Attendance Mode", ["👤 Single Student", "🏫 Classroom"], horizontal=True)
+    latency_panel()
+    
     if st.button("📷 Open Camera", use_container_width=True):
-        cap = cv2.VideoCapture(0)
+        tracker = FaceTracker()
+        pipeline = CameraPipeline(lambda frame: recognize_tracked_faces(frame, tracker))
         
-        if not cap.isOpened():
+        if not pipeline.start():
             st.error("❌ Could not access camera. Please check your webcam connection.")
             return
         
-        camera_placeholder = st.empty()
-        status_placeholder = st.empty()
-        result_placeholder = st.empty()
+        try:
+            if mode == "🏫 Classroom":
+                classroom_attendance_loop(pipeline)
+            else:
+                single_attendance_loop(pipeline)
+        finally:
+            pipeline.stop()
+
+def latency_panel():
+    """Per-stage recognition timings from the latency instrumentation"""
+    with st.expander("⏱️ Recognition Latency"):
+        enabled = st.checkbox("Record per-stage timings", value=latency_metrics.is_enabled())
+        latency_metrics.set_enabled(enabled)
+        metrics = latency_metrics.snapshot()
+        
+        if metrics['stages']:
+            st.dataframe(pd.DataFrame.from_dict(metrics['stages'], orient='index'), use_container_width=True)
+        else:
+            st.caption("No timings recorded yet.")
+        if metrics['counters']:
+            st.caption(" · ".join(f"{name}: {value}" for name, value in metrics['counters'].items()))
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("📥 Download JSON", json.dumps(metrics, indent=2),
+                               file_name="latency_metrics.json", mime="application/json")
+        with col2:
+            if st.button("🔄 Reset Timings"):
+                latency_metrics.reset()
+
+def pipeline_caption(pipeline: CameraPipeline) -> str:
+    """One-line summary of the camera pipeline stage rates and drops"""
+    stats = pipeline.stats()
+    return (f"Camera {stats['capture']['fps']:.0f} fps · "
+            f"Recognition {stats['inference']['fps']:.1f} fps "
+            f"({stats['inference']['avg_latency_ms']:.0f} ms, {stats['capture']['dropped']} frames skipped) · "
+            f"Display {stats['display']['fps']:.0f} fps")
+
+def single_attendance_loop(pipeline: CameraPipeline):
+    """Show the camera feed until one student is recognised, then mark them"""
+    camera_placeholder = st.empty()
+    status_placeholder = st.empty()
+    result_placeholder = st.empty()
+    
+    st.button("⏹️ Stop Camera")
+    
+    for frame, result in pipeline.display(DISPLAY_FPS):
+        display_frame = cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB)
+        camera_placeholder.image(display_frame, channels="RGB", use_container_width=True)
+        status_placeholder.caption(pipeline_caption(pipeline))
+        
+        if result is None:
+            continue
         
-        stop_button = st.button("⏹️ Stop Camera")
+        student_id, confidence = next(((sid, conf) for _, sid, conf, _ in result.output if sid is not None),
+                                      (None, 0.0))
         
-        while not stop_button:
-            ret, frame = cap.read()
-            if not ret:
+        if student_id is not None:
+            student = get_student_by_id(student_id)
+            if student:
+                mark_attendance(student_id, student['name']).result()
+                
+                result_placeholder.markdown(f"""
+                    <div class="success-box">
+                        <h2>✅ Attendance Marked!</h2>
+                        <p><strong>Name:</strong> {student['name']}</p>
+                        <p><strong>Roll Number:</strong> {student['roll_number']}</p>
+                        <p><strong>Class:</strong> {student['class']}</p>
+                        <p><strong>Confidence:</strong> {confidence*100:.1f}%</p>
+                        <p><strong>Time:</strong> {datetime.now().strftime('%I:%M %p')}</p>
+                    </div>
+                """, unsafe_allow_html=True)
+                camera_placeholder.empty()
+                status_placeholder.empty()
                 break
+
+def classroom_attendance_loop(pipeline: CameraPipeline):
+    """Recognise every face in the feed and mark each student once"""
+    camera_placeholder = st.empty()
+    status_placeholder = st.empty()
+    result_placeholder = st.empty()
+    error_placeholder = st.empty()
+    
+    st.button("⏹️ Stop Camera")
+    marked = {}
+    pending = {}
+    labels = []
+    
+    for frame, result in pipeline.display(DISPLAY_FPS):
+        if result is not None:
+            labels = []
+            for _, student_id, confidence, bbox in result.output:
+                label = "Unknown"
+                color = (0, 0, 255)
+                
+                if student_id is not None:
+                    student = marked.get(student_id) or get_student_by_id(student_id)
+                    if student:
+                        if student_id not in marked:
+                            pending[student_id] = mark_attendance(student_id, student['name'])
+                            marked[student_id] = student
+                        label = f"{student['name']} ({confidence*100:.0f}%)"
+                        color = (0, 200, 0)
+                
+                labels.append((bbox, label, color))
             
-            display_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            camera_placeholder.image(display_frame, channels="RGB", use_container_width=True)
-            
-            student_id, confidence = predict_face(frame)
-            
-            if student_id is not None:
-                student = get_student_by_id(student_id)
-                if student:
-                    mark_attendance(student_id, student['name'])
-                    cap.release()
-                    
-                    result_placeholder.markdown(f"""
-                        <div class="success-box">
-                            <h2>✅ Attendance Marked!</h2>
-                            <p><strong>Name:</strong> {student['name']}</p>
-                            <p><strong>Roll Number:</strong> {student['roll_number']}</p>
-                            <p><strong>Class:</strong> {student['class']}</p>
-                            <p><strong>Confidence:</strong> {confidence*100:.1f}%</p>
-                            <p><strong>Time:</strong> {datetime.now().strftime('%I:%M %p')}</p>
-                        </div>
-                    """, unsafe_allow_html=True)
-                    camera_placeholder.empty()
-                    status_placeholder.empty()
-                    break
+            # A failed write is reported and the student is marked again when next recognised
+            for student_id in [sid for sid, future in pending.items() if future.done()]:
+                error = pending.pop(student_id).exception()
+                if error is not None:
+                    student = marked.pop(student_id)
+                    error_placeholder.error(f"❌ Could not mark {student['name']}: {error}")
             
-            time.sleep(0.1)
+            if marked:
+                names = "".join(f"<p>✅ {s['name']} ({s['roll_number'] or '-'})</p>" for s in marked.values())
+                result_placeholder.markdown(f"""
+                    <div class="success-box">
+                        <h3>Marked Present: {len(marked)}</h3>
+                        {names}
+                    </div>
+                """, unsafe_allow_html=True)
+            else:
+                result_placeholder.empty()
+        
+        image = frame.image.copy()
+        for (x1, y1, x2, y2), label, color in labels:
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(image, label, (x1, max(0, y1 - 8)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
         
-        if cap.isOpened():
-            cap.release()
+        display_frame = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        camera_placeholder.image(display_frame, channels="RGB", use_container_width=True)
+        status_placeholder.caption(pipeline_caption(pipeline))
 
 def view_students_page():
     """View and manage students"""
@@ -784,7 +948,7 @@ def manual_attendance_page():
                 student = get_student_by_id(student_id)
                 
                 if student:
-                    mark_attendance(student_id, student['name'])
+                    mark_attendance(student_id, student['name']).result()
                     st.success(f"✅ Attendance marked for {student['name']}")
                     st.balloons()
         
@@ -855,27 +1019,49 @@ def train_model_page():
         </div>
     """, unsafe_allow_html=True)
     
-    if st.button("🚀 Start Training", use_container_width=True):
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        def update_progress(progress, message):
-            progress_bar.progress(progress / 100)
-            status_text.text(message)
-        
-        success = train_model(update_progress)
-        
-        if success:
-            st.markdown("""
-                <div class="success-box">
-                    <h2>✅ Training Completed Successfully!</h2>
-                    <p>The face recognition model is now ready to use.</p>
-                    <p>You can now mark attendance using the camera.</p>
-                </div>
-            """, unsafe_allow_html=True)
+    manager = training_manager()
+    status = manager.status()
+    
+    if status['running']:
+        if st.button("⏹️ Cancel Training", use_container_width=True):
+            manager.cancel(status['job_id'])
+        status = follow_training_job(manager)
+    elif st.button("🚀 Start Training", use_container_width=True):
+        if manager.start() is None:
+            st.warning("⏳ Training is already running in another session.")
+        status = follow_training_job(manager)
+    
+    if status.get('state') == 'succeeded':
+        st.markdown("""
+            <div class="success-box">
+                <h2>✅ Training Completed Successfully!</h2>
+                <p>The face recognition model is now ready to use.</p>
+                <p>You can now mark attendance using the camera.</p>
+            </div>
+        """, unsafe_allow_html=True)
+        if (status.get('finished_at') or 0) > time.time() - 5:
             st.balloons()
-        else:
-            st.error("❌ Training failed. Please ensure students have face photos.")
+    elif status.get('state') == 'failed':
+        st.error(f"❌ Training failed: {status.get('error') or 'please ensure students have face photos.'}")
+    elif status.get('state') in ('cancelled', 'interrupted'):
+        st.warning(f"⚠️ {status['message']}")
+
+def follow_training_job(manager) -> dict:
+    """Show the running job's progress until it finishes (survives page reruns)"""
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    status = manager.status()
+    
+    while status['running']:
+        progress_bar.progress(status['progress'] / 100)
+        note = " (cancelling...)" if status['cancel_requested'] else ""
+        status_text.text(f"{status['message']}{note}")
+        time.sleep(0.5)
+        status = manager.status()
+    
+    progress_bar.progress(status.get('progress', 0) / 100)
+    status_text.text(status.get('message', ''))
+    return status
 
 def main():
     """Main application"""
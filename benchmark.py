@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import platform
+import numpy as np
+import cv2
+from typing import Callable, Dict, List, Optional, Tuple
+
+import database
+import face_recognition_model
+from database import (
+    init_database, bulk_import_students, mark_attendance, get_attendance_stats,
+    get_class_wise_attendance, get_student_attendance_summary
+)
+from face_recognition_model import (
+    DATASET_DIR, save_face_image, extract_face_embedding, train_model, predict_face
+)
+
+BENCHMARK_DIR = "benchmark_workspace"
+BASELINE_PATH = "benchmark_baseline.json"
+RESULTS_PATH = "benchmark_results.json"
+CLASSES = ["Grade 6", "Grade 7", "Grade 8", "Grade 9", "Grade 10"]
+SECTIONS = ["A", "B", "C"]
+
+def draw_face(traits: dict, rng: np.random.Generator, size: int = 256) -> np.ndarray:
+    """Draw a cartoon face that MediaPipe detects, with per-image jitter
+    
+    traits fixes the identity (skin and hair colour, eye spacing, mouth and
+    face shape); rng varies position, lighting and noise between images.
+    """
+    image = np.full((size, size, 3), traits['background'], dtype=np.uint8)
+    cx, cy = size // 2 + rng.integers(-12, 13, 2)
+    skin = traits['skin']
+    face_w, face_h = int(size * traits['face_w']), int(size * traits['face_h'])
+    cv2.ellipse(image, (int(cx), int(cy)), (face_w, face_h), 0, 0, 360, skin, -1)
+    
+    eye_y = int(cy - size * 0.08)
+    eye_dx = int(size * traits['eye_spacing'])
+    for dx in (-eye_dx, eye_dx):
+        cv2.ellipse(image, (int(cx + dx), eye_y), (size // 22, size // 40), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(image, (int(cx + dx), eye_y), size // 55, traits['iris'], -1)
+        cv2.line(image, (int(cx + dx - size // 20), eye_y - size // 18),
+                 (int(cx + dx + size // 20), eye_y - size // 18), traits['hair'], 3)
+    
+    nose = tuple(int(c * 0.7) for c in skin)
+    cv2.line(image, (int(cx), eye_y + size // 30), (int(cx - size // 40), int(cy + size // 16)), nose, 3)
+    cv2.ellipse(image, (int(cx), int(cy + size // 7)), (int(size * traits['mouth_w']), size // 40),
+                0, 0, 180, (60, 60, 150), -1)
+    cv2.ellipse(image, (int(cx), int(cy - face_h * 0.75)), (face_w + 4, size // 8), 0, 180, 360, traits['hair'], -1)
+    
+    image = cv2.convertScaleAbs(image, alpha=rng.uniform(0.85, 1.15), beta=rng.uniform(-15, 15))
+    noise = rng.normal(0, 4, image.shape)
+    return cv2.GaussianBlur(np.clip(image + noise, 0, 255).astype(np.uint8), (5, 5), 0)
+
+def random_traits(rng: np.random.Generator) -> dict:
+    """Identity parameters for one synthetic student"""
+    def colour(low, high):
+        return tuple(int(v) for v in rng.integers(low, high))
+    
+    return {
+        'background': colour([60, 60, 60], [200, 200, 200]),
+        'skin': colour([90, 120, 160], [140, 170, 230]),
+        'hair': colour([10, 10, 10], [90, 80, 120]),
+        'iris': colour([20, 20, 20], [120, 100, 80]),
+        'face_w': rng.uniform(0.22, 0.27),
+        'face_h': rng.uniform(0.30, 0.35),
+        'eye_spacing': rng.uniform(0.09, 0.13),
+        'mouth_w': rng.uniform(0.06, 0.10),
+    }
+
+def generate_enrollment(n_students: int, n_images: int, seed: int = 0) -> List[int]:
+    """Register n_students with n_images synthetic face photos each"""
+    rng = np.random.default_rng(seed)
+    students = [{'name': f"Student {i:05d}", 'roll_number': f"R{i:05d}",
+                 'class': CLASSES[i % len(CLASSES)], 'section': SECTIONS[(i // len(CLASSES)) % len(SECTIONS)],
+                 'registration_number': f"REG{i:05d}"} for i in range(n_students)]
+    bulk_import_students(students)
+    
+    with database.connection() as conn:
+        student_ids = [row[0] for row in conn.execute("SELECT id FROM students ORDER BY id")]
+    
+    for student_id in student_ids:
+        traits = random_traits(rng)
+        for idx in range(n_images):
+            save_face_image(student_id, draw_face(traits, rng), idx)
+    return student_ids
+
+def generate_history(student_ids: List[int], years: float, attendance_rate: float = 0.9,
+                     seed: int = 0) -> int:
+    """Fill the attendance table with school-day history ending yesterday"""
+    rng = np.random.default_rng(seed)
+    today = datetime.date.today()
+    days = [today - datetime.timedelta(days=d) for d in range(int(years * 365), 0, -1)]
+    school_days = [d for d in days if d.weekday() < 5]
+    
+    total = 0
+    ids = np.array(student_ids)
+    with database.connection() as conn:
+        names = dict(conn.execute("SELECT id, name FROM students"))
+        for day in school_days:
+            present = ids[rng.random(len(ids)) < attendance_rate]
+            offsets = rng.integers(8 * 3600 * 10**6, 9 * 3600 * 10**6, len(present))
+            start = datetime.datetime.combine(day, datetime.time())
+            rows = [(int(sid), names[int(sid)], (start + datetime.timedelta(microseconds=int(us))).isoformat())
+                    for sid, us in zip(present, offsets)]
+            conn.executemany("INSERT INTO attendance (student_id, name, timestamp) VALUES (?, ?, ?)", rows)
+            total += len(rows)
+    return total
+
+def time_call(fn: Callable, args_list: List[tuple]) -> dict:
+    """Call fn once per args tuple and summarise the latencies in milliseconds"""
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    
+    timings = np.array(timings)
+    return {
+        'calls': len(timings),
+        'mean_ms': round(float(timings.mean()), 3),
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'min_ms': round(float(timings.min()), 3),
+    }
+
+def sample_images(student_ids: List[int], n: int, rng: np.random.Generator) -> List[Tuple[int, np.ndarray]]:
+    """Read n random dataset images as (student_id, image) pairs"""
+    samples = []
+    for student_id in rng.choice(student_ids, n):
+        folder = os.path.join(DATASET_DIR, str(student_id))
+        path = os.path.join(folder, rng.choice(sorted(os.listdir(folder))))
+        samples.append((int(student_id), cv2.imread(path)))
+    return samples
+
+def run_size(n_students: int, n_images: int, years: float, repeats: int, seed: int = 0) -> dict:
+    """Build a fresh workspace for one size and time every hot path in it"""
+    for path in (DATASET_DIR, face_recognition_model.MODEL_DIR):
+        shutil.rmtree(path, ignore_errors=True)
+    database.close_connections()
+    for path in (database.DB_PATH, f"{database.DB_PATH}-wal", f"{database.DB_PATH}-shm",
+                 face_recognition_model.EMBEDDING_CACHE_PATH):
+        if os.path.exists(path):
+            os.remove(path)
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    face_recognition_model._model_holder.invalidate()
+    
+    init_database()
+    start = time.perf_counter()
+    student_ids = generate_enrollment(n_students, n_images, seed)
+    history_rows = generate_history(student_ids, years, seed=seed)
+    setup_s = time.perf_counter() - start
+    
+    rng = np.random.default_rng(seed + 1)
+    samples = sample_images(student_ids, repeats, rng)
+    results = {'students': n_students, 'images_per_student': n_images, 'history_years': years,
+               'attendance_rows': history_rows, 'setup_s': round(setup_s, 2)}
+    
+    extract_face_embedding(samples[0][1])
+    results['extract_face_embedding'] = time_call(extract_face_embedding, [(image,) for _, image in samples])
+    results['train_model_cold'] = time_call(train_model, [()])
+    results['train_model_cached'] = time_call(train_model, [()])
+    results['predict_face'] = time_call(predict_face, [(image,) for _, image in samples])
+    correct = sum(predict_face(image)[0] == student_id for student_id, image in samples)
+    results['predict_accuracy'] = round(correct / len(samples), 4)
+    
+    marks = [(int(sid), "benchmark") for sid in rng.choice(student_ids, repeats)]
+    pending = []
+    results['mark_attendance'] = time_call(lambda *args: pending.append(mark_attendance(*args)), marks)
+    for future in pending:
+        future.result()
+    results['mark_attendance_committed'] = time_call(lambda *args: mark_attendance(*args).result(), marks)
+    results['get_attendance_stats'] = time_call(get_attendance_stats, [(30,)] * repeats)
+    results['get_class_wise_attendance'] = time_call(get_class_wise_attendance, [("month",)] * repeats)
+    results['get_student_attendance_summary'] = time_call(get_student_attendance_summary, [()] * repeats)
+    return results
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[dict]:
+    """Median latency of every size/operation relative to the baseline run"""
+    rows = []
+    for size, metrics in results.items():
+        for name, current in metrics.items():
+            previous = baseline.get(size, {}).get(name)
+            if not isinstance(current, dict) or not isinstance(previous, dict):
+                continue
+            ratio = current['p50_ms'] / max(previous['p50_ms'], 1e-6)
+            rows.append({'size': size, 'operation': name, 'baseline_ms': previous['p50_ms'],
+                         'current_ms': current['p50_ms'], 'ratio': round(ratio, 3),
+                         'regression': ratio > 1 + tolerance})
+    return rows
+
+def parse_size(text: str) -> Tuple[int, int]:
+    students, _, images = text.lower().partition('x')
+    return int(students), int(images or 10)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark enrollment, training, recognition and reporting")
+    parser.add_argument("--sizes", nargs="+", default=["20x5", "100x10"],
+                        help="STUDENTSxIMAGES per run, e.g. 100x10")
+    parser.add_argument("--years", type=float, default=1.0, help="years of attendance history to generate")
+    parser.add_argument("--repeats", type=int, default=20, help="calls per timed operation")
+    parser.add_argument("--workdir", default=BENCHMARK_DIR, help="scratch directory for dataset and database")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+    
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline)
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    
+    results = {}
+    for size in args.sizes:
+        n_students, n_images = parse_size(size)
+        print(f"Benchmarking {n_students} students x {n_images} images, {args.years} years of history...", flush=True)
+        results[size] = run_size(n_students, n_images, args.years, args.repeats)
+        print(json.dumps(results[size], indent=2), flush=True)
+    
+    report = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    
+    comparison: Optional[List[dict]] = None
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path) as f:
+            comparison = compare(results, json.load(f)['results'], args.tolerance)
+        report['comparison'] = comparison
+        print(f"\n{'size':>10} {'operation':<32} {'baseline':>10} {'current':>10} {'ratio':>7}")
+        for row in comparison:
+            flag = "  REGRESSION" if row['regression'] else ""
+            print(f"{row['size']:>10} {row['operation']:<32} {row['baseline_ms']:>10.2f} "
+                  f"{row['current_ms']:>10.2f} {row['ratio']:>7.2f}{flag}")
+    
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+    
+    if args.save_baseline:
+        shutil.copyfile(output, baseline_path)
+        print(f"Saved baseline to {baseline_path}")
+    
+    if args.fail_on_regression and comparison and any(row['regression'] for row in comparison):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
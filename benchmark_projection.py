@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import pickle
+import argparse
+import numpy as np
+import cv2
+from typing import Dict, List, Tuple
+from sklearn.model_selection import train_test_split
+
+from embedding_cache import EmbeddingCache, EMBEDDING_CACHE_PATH
+from projection import PROJECTIONS, ProjectedModel, fit_projection
+from face_recognition_model import RECOGNITION_ENGINES, fit_engine
+
+def synthetic_faces(n_students: int, n_images: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Face-like 64x64 grey embeddings: a smooth per-student pattern plus per-image jitter"""
+    rng = np.random.default_rng(seed)
+    X = []
+    y = []
+    for student_id in range(n_students):
+        base = cv2.resize(rng.uniform(0, 255, (8, 8)).astype(np.float32), (72, 72),
+                          interpolation=cv2.INTER_CUBIC)
+        for _ in range(n_images):
+            dx, dy = rng.integers(0, 9, 2)
+            face = base[dy:dy + 64, dx:dx + 64] * rng.uniform(0.8, 1.2) + rng.normal(0, 12, (64, 64))
+            X.append(np.clip(face, 0, 255).flatten() / 255.0)
+            y.append(student_id)
+    return np.array(X, dtype=np.float32), np.array(y)
+
+def dataset_faces() -> Tuple[np.ndarray, np.ndarray]:
+    """Embeddings of every cached dataset image with a detected face"""
+    cache = EmbeddingCache.load(EMBEDDING_CACHE_PATH)
+    if not len(cache):
+        raise SystemExit("Embedding cache is empty; run train_model first or omit --dataset")
+    
+    with np.load(cache.path) as data:
+        has_face = data['has_face']
+        return data['features'][has_face].astype(np.float32) / 255.0, data['labels'][has_face]
+
+def run(X: np.ndarray, y: np.ndarray, engines: List[str], projections: List[str]) -> List[Dict]:
+    """Fit every engine/projection pair and time it on a held-out split"""
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.25, stratify=y, random_state=42)
+    results = []
+    
+    for projection in projections:
+        for engine in engines:
+            start = time.perf_counter()
+            projector = fit_projection(X_train, y_train, projection)
+            projected = ProjectedModel.from_pipeline(projector, None) if projector is not None else None
+            X_fit = projected.transform(X_train) if projected is not None else X_train
+            model = fit_engine(X_fit, y_train, engine)
+            if projected is not None:
+                projected.model = model
+                model = projected
+            fit_s = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            for row in X_test:
+                model.predict_proba(row[np.newaxis, :])
+            predict_ms = (time.perf_counter() - start) * 1000 / len(X_test)
+            
+            predicted = model.classes_[np.argmax(model.predict_proba(X_test), axis=1)]
+            results.append({
+                'projection': projection,
+                'engine': engine,
+                'dims': X_fit.shape[1],
+                'fit_s': round(fit_s, 3),
+                'predict_ms': round(predict_ms, 3),
+                'model_bytes': len(pickle.dumps(model)),
+                'accuracy': round(float(np.mean(predicted == y_test)), 4)
+            })
+            print(json.dumps(results[-1]), flush=True)
+    
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the projection stage between embedding and classifier")
+    parser.add_argument("--dataset", action="store_true", help="use cached dataset embeddings instead of synthetic faces")
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--images", type=int, default=12)
+    parser.add_argument("--engines", nargs="+", default=["random_forest", "gallery"], choices=RECOGNITION_ENGINES)
+    parser.add_argument("--projections", nargs="+", default=list(PROJECTIONS), choices=PROJECTIONS)
+    parser.add_argument("--output", default="projection_benchmark.json")
+    args = parser.parse_args()
+    
+    X, y = dataset_faces() if args.dataset else synthetic_faces(args.students, args.images)
+    print(f"{len(X)} embeddings of {X.shape[1]} dims, {len(np.unique(y))} students")
+    
+    results = run(X, y, args.engines, args.projections)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {os.path.abspath(args.output)}")
+
+if __name__ == "__main__":
+    main()
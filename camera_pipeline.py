@@ -0,0 +1,211 @@
+import os
+import time
+import threading
+import cv2
+import numpy as np
+from typing import Any, Callable, Iterator, NamedTuple, Optional, Tuple
+
+from latency_metrics import span
+
+CAMERA_INDEX = int(os.environ.get("CAMERA_INDEX", 0))
+DISPLAY_FPS = float(os.environ.get("DISPLAY_FPS", 15))
+
+class Frame(NamedTuple):
+    index: int
+    captured_at: float
+    image: np.ndarray
+
+class InferenceResult(NamedTuple):
+    frame: Frame
+    finished_at: float
+    output: Any
+    
+    @property
+    def latency(self) -> float:
+        """Seconds from frame capture to the end of inference"""
+        return self.finished_at - self.frame.captured_at
+
+class LatestSlot:
+    """Single-item buffer that always holds the newest value
+    
+    put() never blocks: an item that was not taken before the next put is
+    overwritten and counted as a drop. take() waits for an item newer than
+    the caller last saw; peek() reads the newest item without consuming it.
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._seq = 0
+        self._taken_seq = 0
+        self.puts = 0
+        self.drops = 0
+    
+    def put(self, item):
+        with self._cond:
+            if self._seq > self._taken_seq:
+                self.drops += 1
+            self._item = item
+            self._seq += 1
+            self.puts += 1
+            self._cond.notify_all()
+    
+    def take(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """Wait for and consume an item newer than the last one taken"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > self._taken_seq, timeout):
+                return None
+            self._taken_seq = self._seq
+            return self._item
+    
+    def peek(self) -> Tuple[int, Optional[Any]]:
+        """Return (sequence number, newest item) without consuming it"""
+        with self._cond:
+            return self._seq, self._item
+    
+    def wake(self):
+        """Wake up waiting consumers (used on shutdown)"""
+        with self._cond:
+            self._cond.notify_all()
+    
+    @property
+    def depth(self) -> int:
+        return 1 if self._seq > self._taken_seq else 0
+
+class CameraPipeline:
+    """Capture, inference and display stages with latest-frame semantics
+    
+    A capture thread reads the camera as fast as it delivers frames and keeps
+    only the newest one, so the driver buffer never fills with stale frames.
+    An inference thread always works on the newest frame available and
+    publishes its result the same way. The caller's display loop (display())
+    runs at its own rate and shows the newest frame together with the newest
+    result. stats() reports depth, drops, rate and latency for each stage.
+    """
+    
+    def __init__(self, infer: Callable[[np.ndarray], Any], source: int = CAMERA_INDEX, capture=None):
+        self.infer = infer
+        self.source = source
+        self._capture = capture
+        self.frames = LatestSlot()
+        self.results = LatestSlot()
+        self._stop = threading.Event()
+        self._threads = []
+        self._started_at = None
+        self.displayed = 0
+        self.display_skips = 0
+        self.inference_runs = 0
+        self.inference_errors = 0
+        self.last_error: Optional[BaseException] = None
+        self._latency_total = 0.0
+        self.last_latency = 0.0
+    
+    def start(self) -> bool:
+        """Open the camera and start the capture and inference threads"""
+        if self._capture is None:
+            self._capture = cv2.VideoCapture(self.source)
+        if not self._capture.isOpened():
+            return False
+        
+        self._capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._started_at = time.monotonic()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="camera-capture", daemon=True),
+            threading.Thread(target=self._inference_loop, name="camera-inference", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return True
+    
+    def stop(self):
+        """Stop both threads and release the camera"""
+        self._stop.set()
+        self.frames.wake()
+        self.results.wake()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        if self._capture is not None:
+            self._capture.release()
+    
+    @property
+    def running(self) -> bool:
+        return not self._stop.is_set()
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def _capture_loop(self):
+        index = 0
+        while not self._stop.is_set():
+            with span("camera.read"):
+                ret, image = self._capture.read()
+            if not ret:
+                self._stop.set()
+                self.frames.wake()
+                break
+            index += 1
+            self.frames.put(Frame(index, time.monotonic(), image))
+    
+    def _inference_loop(self):
+        while not self._stop.is_set():
+            frame = self.frames.take(timeout=0.5)
+            if frame is None:
+                continue
+            
+            try:
+                output = self.infer(frame.image)
+            except Exception as e:
+                self.inference_errors += 1
+                self.last_error = e
+                continue
+            
+            result = InferenceResult(frame, time.monotonic(), output)
+            self.inference_runs += 1
+            self.last_latency = result.latency
+            self._latency_total += result.latency
+            self.results.put(result)
+    
+    def display(self, fps: float = DISPLAY_FPS) -> Iterator[Tuple[Frame, Optional[InferenceResult]]]:
+        """Yield (newest frame, newest result or None) at most fps times per second
+        
+        Each result is yielded once; later ticks get None until a new one
+        arrives. Stops when the pipeline stops or the camera ends.
+        """
+        interval = 1.0 / fps
+        last_frame_seq = 0
+        next_tick = time.monotonic()
+        
+        while self.running:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_tick = max(next_tick + interval, time.monotonic())
+            
+            seq, frame = self.frames.peek()
+            if frame is None or seq == last_frame_seq:
+                continue
+            self.display_skips += max(0, seq - last_frame_seq - 1)
+            last_frame_seq = seq
+            
+            result = self.results.take(timeout=0)
+            self.displayed += 1
+            yield frame, result
+    
+    def stats(self) -> dict:
+        """Queue depth, drop counts, rates and latency for each stage"""
+        elapsed = max(time.monotonic() - (self._started_at or time.monotonic()), 1e-9)
+        return {
+            'capture': {'frames': self.frames.puts, 'depth': self.frames.depth,
+                        'dropped': self.frames.drops, 'fps': self.frames.puts / elapsed},
+            'inference': {'runs': self.inference_runs, 'errors': self.inference_errors,
+                          'depth': self.results.depth, 'dropped': self.results.drops,
+                          'fps': self.inference_runs / elapsed,
+                          'avg_latency_ms': 1000 * self._latency_total / max(self.inference_runs, 1),
+                          'last_latency_ms': 1000 * self.last_latency},
+            'display': {'frames': self.displayed, 'skipped': self.display_skips,
+                        'fps': self.displayed / elapsed},
+        }
@@ -1,71 +1,217 @@
-import sqlite3
+import os
+import atexit
 import datetime
+import threading
+import numpy as np
 import pandas as pd
+from concurrent.futures import Future
 from typing import List, Dict, Optional, Tuple
+from latency_metrics import span
+from db_connections import SQLiteConnectionPool
+from micro_batcher import MicroBatcher
 
 DB_PATH = "attendance.db"
+PERIOD_DAYS = {'today': 0, 'week': 7, 'month': 30}
+ATTENDANCE_BATCH_SIZE = int(os.environ.get("ATTENDANCE_BATCH_SIZE", 128))
+ATTENDANCE_FLUSH_MS = float(os.environ.get("ATTENDANCE_FLUSH_MS", 0))
+
+# Recomputes every rollup table from attendance and students
+ROLLUP_REBUILD = (
+    "DELETE FROM attendance_daily",
+    "INSERT INTO attendance_daily (date, records) SELECT date, COUNT(*) FROM attendance GROUP BY date",
+    "DELETE FROM student_attendance_totals",
+    """INSERT INTO student_attendance_totals (student_id, records, last_seen)
+       SELECT student_id, COUNT(*), MAX(timestamp) FROM attendance GROUP BY student_id""",
+    "DELETE FROM class_daily_attendance",
+    """INSERT INTO class_daily_attendance (date, class, section, present)
+       SELECT a.date, IFNULL(s.class, ''), IFNULL(s.section, ''), COUNT(DISTINCT a.student_id)
+       FROM attendance a JOIN students s ON s.id = a.student_id
+       GROUP BY a.date, IFNULL(s.class, ''), IFNULL(s.section, '')""",
+)
+
+# Each entry upgrades the schema by one version (PRAGMA user_version)
+SCHEMA_MIGRATIONS = [
+    # 1: indexed attendance date (derived from the ISO timestamp) and per-student/per-class lookups
+    (
+        "ALTER TABLE attendance ADD COLUMN date TEXT GENERATED ALWAYS AS (substr(timestamp, 1, 10)) VIRTUAL",
+        "CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)",
+        "CREATE INDEX IF NOT EXISTS idx_attendance_student_date ON attendance(student_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_attendance_student_timestamp ON attendance(student_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_students_class_section ON students(class, section)",
+    ),
+    # 2: attendance records per day, kept current by triggers in the writing transaction
+    (
+        "CREATE TABLE attendance_daily (date TEXT PRIMARY KEY, records INTEGER NOT NULL) WITHOUT ROWID",
+        "INSERT INTO attendance_daily (date, records) SELECT date, COUNT(*) FROM attendance GROUP BY date",
+        """CREATE TRIGGER attendance_daily_insert AFTER INSERT ON attendance BEGIN
+               INSERT INTO attendance_daily (date, records) VALUES (NEW.date, 1)
+               ON CONFLICT(date) DO UPDATE SET records = records + 1;
+           END""",
+        """CREATE TRIGGER attendance_daily_delete AFTER DELETE ON attendance BEGIN
+               UPDATE attendance_daily SET records = records - 1 WHERE date = OLD.date;
+           END""",
+        """CREATE TRIGGER attendance_daily_update AFTER UPDATE OF timestamp ON attendance BEGIN
+               UPDATE attendance_daily SET records = records - 1 WHERE date = OLD.date;
+               INSERT INTO attendance_daily (date, records) VALUES (NEW.date, 1)
+               ON CONFLICT(date) DO UPDATE SET records = records + 1;
+           END""",
+    ),
+    # 3: per-student totals and per-day class/section present counts, kept current by triggers
+    (
+        """CREATE TABLE student_attendance_totals (
+               student_id INTEGER PRIMARY KEY,
+               records INTEGER NOT NULL,
+               last_seen TEXT
+           )""",
+        """CREATE TABLE class_daily_attendance (
+               date TEXT NOT NULL,
+               class TEXT NOT NULL,
+               section TEXT NOT NULL,
+               present INTEGER NOT NULL,
+               PRIMARY KEY (date, class, section)
+           ) WITHOUT ROWID""",
+        *ROLLUP_REBUILD[2:],
+        """CREATE TRIGGER attendance_rollups_insert AFTER INSERT ON attendance BEGIN
+               INSERT INTO student_attendance_totals (student_id, records, last_seen)
+               VALUES (NEW.student_id, 1, NEW.timestamp)
+               ON CONFLICT(student_id) DO UPDATE SET records = records + 1,
+                   last_seen = max(IFNULL(last_seen, ''), excluded.last_seen);
+               INSERT INTO class_daily_attendance (date, class, section, present)
+               SELECT NEW.date, IFNULL(s.class, ''), IFNULL(s.section, ''), 1 FROM students s
+               WHERE s.id = NEW.student_id
+                 AND NOT EXISTS (SELECT 1 FROM attendance a
+                                 WHERE a.student_id = NEW.student_id AND a.date = NEW.date AND a.id != NEW.id)
+               ON CONFLICT(date, class, section) DO UPDATE SET present = present + 1;
+           END""",
+        """CREATE TRIGGER attendance_rollups_delete AFTER DELETE ON attendance BEGIN
+               UPDATE student_attendance_totals SET records = records - 1,
+                   last_seen = (SELECT MAX(timestamp) FROM attendance WHERE student_id = OLD.student_id)
+               WHERE student_id = OLD.student_id;
+               UPDATE class_daily_attendance SET present = present - 1
+               WHERE date = OLD.date
+                 AND (class, section) = (SELECT IFNULL(class, ''), IFNULL(section, '') FROM students
+                                         WHERE id = OLD.student_id)
+                 AND NOT EXISTS (SELECT 1 FROM attendance WHERE student_id = OLD.student_id AND date = OLD.date);
+           END""",
+        """CREATE TRIGGER students_rollups_delete AFTER DELETE ON students BEGIN
+               DELETE FROM student_attendance_totals WHERE student_id = OLD.id;
+           END""",
+        """CREATE TRIGGER students_rollups_move AFTER UPDATE OF class, section ON students BEGIN
+               UPDATE class_daily_attendance SET present = present - 1
+               WHERE class = IFNULL(OLD.class, '') AND section = IFNULL(OLD.section, '')
+                 AND date IN (SELECT date FROM attendance WHERE student_id = OLD.id);
+               INSERT INTO class_daily_attendance (date, class, section, present)
+               SELECT DISTINCT date, IFNULL(NEW.class, ''), IFNULL(NEW.section, ''), 1 FROM attendance
+               WHERE student_id = NEW.id
+               ON CONFLICT(date, class, section) DO UPDATE SET present = present + 1;
+           END""",
+    ),
+]
+STATS_ROLLUP_MIN_DAYS = 31  # longer get_attendance_stats windows read attendance_daily
+
+_pool: Optional[SQLiteConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def connection():
+    """Pooled connection to DB_PATH as a context manager that commits on success"""
+    global _pool
+    path = os.path.abspath(DB_PATH)
+    pool = _pool
+    if pool is None or pool.path != path:
+        with _pool_lock:
+            if _pool is None or _pool.path != path:
+                if _pool is not None:
+                    _pool.close()
+                _pool = SQLiteConnectionPool(path)
+            pool = _pool
+    return pool.connection()
+
+def close_connections():
+    """Write queued attendance and close the pooled connections, e.g. before deleting or replacing the database file"""
+    global _pool
+    close_attendance_writer()
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
 
 def init_database():
     """Initialize the SQLite database with required tables"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS students (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            roll_number TEXT,
-            class TEXT,
-            section TEXT,
-            registration_number TEXT,
-            created_at TEXT
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER,
-            name TEXT,
-            timestamp TEXT,
-            FOREIGN KEY (student_id) REFERENCES students(id)
-        )
-    """)
-    
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS students (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                roll_number TEXT,
+                class TEXT,
+                section TEXT,
+                registration_number TEXT,
+                created_at TEXT
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS attendance (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id INTEGER,
+                name TEXT,
+                timestamp TEXT,
+                FOREIGN KEY (student_id) REFERENCES students(id)
+            )
+        """)
+        
+        migrate_schema(conn)
+
+def migrate_schema(conn) -> int:
+    """Apply pending SCHEMA_MIGRATIONS in one transaction and return the schema version"""
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(SCHEMA_MIGRATIONS[version:], version + 1):
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {number}")
     conn.commit()
-    conn.close()
+    return max(version, len(SCHEMA_MIGRATIONS))
+
+def rebuild_rollups() -> Dict[str, int]:
+    """Recompute every rollup table from the attendance and students tables"""
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for statement in ROLLUP_REBUILD:
+            conn.execute(statement)
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("attendance_daily", "student_attendance_totals", "class_daily_attendance")}
+
+def _period_filter(period: str, column: str = "date") -> Tuple[str, tuple]:
+    """SQL condition on a date column for a dashboard period ("today", "week", "month"); empty for all time"""
+    if period not in PERIOD_DAYS:
+        return "", ()
+    start = (datetime.date.today() - datetime.timedelta(days=PERIOD_DAYS[period])).isoformat()
+    return (f"{column} = ?" if period == "today" else f"{column} >= ?"), (start,)
 
-def add_student(name: str, roll_number: str = "", class_name: str = "", 
+def add_student(name: str, roll_number: str = "", class_name: str = "",
                 section: str = "", registration_number: str = "") -> int:
     """Add a new student to the database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     created_at = datetime.datetime.now().isoformat()
-    cursor.execute("""
-        INSERT INTO students (name, roll_number, class, section, registration_number, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (name, roll_number, class_name, section, registration_number, created_at))
-    
-    student_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.execute("""
+            INSERT INTO students (name, roll_number, class, section, registration_number, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (name, roll_number, class_name, section, registration_number, created_at))
     
-    return student_id
+    return cursor.lastrowid
 
 def get_all_students() -> List[Dict]:
     """Get all students from the database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, name, roll_number, class, section, registration_number, created_at
-        FROM students
-        ORDER BY created_at DESC
-    """)
-    
-    rows = cursor.fetchall()
-    conn.close()
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT id, name, roll_number, class, section, registration_number, created_at
+            FROM students
+            ORDER BY created_at DESC
+        """).fetchall()
     
     students = []
     for row in rows:
@@ -83,17 +229,12 @@ def get_all_students() -> List[Dict]:
 
 def get_student_by_id(student_id: int) -> Optional[Dict]:
     """Get a student by ID"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, name, roll_number, class, section, registration_number
-        FROM students
-        WHERE id = ?
-    """, (student_id,))
-    
-    row = cursor.fetchone()
-    conn.close()
+    with connection() as conn:
+        row = conn.execute("""
+            SELECT id, name, roll_number, class, section, registration_number
+            FROM students
+            WHERE id = ?
+        """, (student_id,)).fetchone()
     
     if row:
         return {
@@ -108,52 +249,73 @@ def get_student_by_id(student_id: int) -> Optional[Dict]:
 
 def delete_student(student_id: int):
     """Delete a student and their attendance records"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("DELETE FROM attendance WHERE student_id = ?", (student_id,))
-    cursor.execute("DELETE FROM students WHERE id = ?", (student_id,))
-    
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute("DELETE FROM attendance WHERE student_id = ?", (student_id,))
+        conn.execute("DELETE FROM students WHERE id = ?", (student_id,))
 
-def mark_attendance(student_id: int, name: str):
-    """Mark attendance for a student"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    timestamp = datetime.datetime.now().isoformat()
-    cursor.execute("""
-        INSERT INTO attendance (student_id, name, timestamp)
-        VALUES (?, ?, ?)
-    """, (student_id, name, timestamp))
-    
-    conn.commit()
-    conn.close()
+def _write_attendance_batch(events: List[Tuple[int, str, str]]) -> List[str]:
+    """Insert (student_id, name, timestamp) events in one transaction; returns their timestamps"""
+    with span("db.attendance_flush"), connection() as conn:
+        conn.executemany("""
+            INSERT INTO attendance (student_id, name, timestamp)
+            VALUES (?, ?, ?)
+        """, events)
+    return [timestamp for _, _, timestamp in events]
+
+_attendance_writer: Optional[MicroBatcher] = None
+_writer_lock = threading.Lock()
+
+def attendance_writer() -> MicroBatcher:
+    """Process-wide group-commit writer for attendance events, started on first use"""
+    global _attendance_writer
+    with _writer_lock:
+        if _attendance_writer is None:
+            _attendance_writer = MicroBatcher(_write_attendance_batch, ATTENDANCE_BATCH_SIZE, ATTENDANCE_FLUSH_MS,
+                                              name="attendance-writer")
+        return _attendance_writer
+
+def close_attendance_writer():
+    """Commit every queued attendance event and stop the writer (also runs at exit)"""
+    global _attendance_writer
+    with _writer_lock:
+        writer, _attendance_writer = _attendance_writer, None
+    if writer is not None:
+        writer.close(timeout=None)
+
+atexit.register(close_attendance_writer)
+
+def attendance_writer_stats() -> dict:
+    """Batch sizes, queue depth and queueing delay of the attendance writer"""
+    if ATTENDANCE_BATCH_SIZE <= 1:
+        return {}
+    return attendance_writer().stats()
+
+def mark_attendance(student_id: int, name: str) -> Future:
+    """Mark attendance for a student; returns a future resolving to its timestamp once committed"""
+    with span("db.mark_attendance"):
+        event = (student_id, name, datetime.datetime.now().isoformat())
+        if ATTENDANCE_BATCH_SIZE > 1:
+            return attendance_writer().submit(event)
+        
+        future = Future()
+        future.set_result(_write_attendance_batch([event])[0])
+        return future
 
 def get_attendance_records(period: str = "all") -> pd.DataFrame:
     """Get attendance records with optional filtering"""
-    conn = sqlite3.connect(DB_PATH)
-    
     query = "SELECT id, student_id, name, timestamp FROM attendance"
     
-    if period == "today":
-        today = datetime.date.today().isoformat()
-        query += f" WHERE date(timestamp) = '{today}'"
-    elif period == "week":
-        week_ago = (datetime.date.today() - datetime.timedelta(days=7)).isoformat()
-        query += f" WHERE date(timestamp) >= '{week_ago}'"
-    elif period == "month":
-        month_ago = (datetime.date.today() - datetime.timedelta(days=30)).isoformat()
-        query += f" WHERE date(timestamp) >= '{month_ago}'"
+    condition, params = _period_filter(period)
+    if condition:
+        query += f" WHERE {condition}"
     
     query += " ORDER BY timestamp DESC"
     
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    with connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
     
     if not df.empty:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
         df['date'] = df['timestamp'].dt.date
         df['time'] = df['timestamp'].dt.strftime('%H:%M:%S')
     
@@ -161,117 +323,109 @@ def get_attendance_records(period: str = "all") -> pd.DataFrame:
 
 def get_attendance_stats(days: int = 30) -> Tuple[List[str], List[int]]:
     """Get attendance statistics for the last N days"""
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT timestamp FROM attendance", conn)
-    conn.close()
-    
-    if df.empty:
-        dates = [(datetime.date.today() - datetime.timedelta(days=i)).strftime("%d %b") 
-                 for i in range(days-1, -1, -1)]
-        return dates, [0] * days
-    
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df['date'] = df['timestamp'].dt.date
-    
-    last_n_days = [(datetime.date.today() - datetime.timedelta(days=i)) for i in range(days-1, -1, -1)]
-    counts = [int(df[df['date'] == d].shape[0]) for d in last_n_days]
-    dates = [d.strftime("%d %b") for d in last_n_days]
-    
-    return dates, counts
+    start = np.datetime64(datetime.date.today() - datetime.timedelta(days=days - 1), 'D')
+    if days > STATS_ROLLUP_MIN_DAYS:
+        query = "SELECT date, records FROM attendance_daily WHERE date >= ? AND records > 0"
+    else:
+        query = "SELECT date, COUNT(*) FROM attendance WHERE date >= ? GROUP BY date"
+    
+    with connection() as conn:
+        rows = conn.execute(query, (str(start),)).fetchall()
+    
+    counts = np.zeros(days, dtype=np.int64)
+    if rows:
+        offsets = (np.array([row[0] for row in rows], dtype='datetime64[D]') - start).astype(np.int64)
+        in_window = offsets < days
+        counts[offsets[in_window]] = [row[1] for row, keep in zip(rows, in_window) if keep]
+    
+    dates = [day.strftime("%d %b") for day in (start + np.arange(days)).tolist()]
+    return dates, counts.tolist()
 
 def get_total_students() -> int:
     """Get total number of students"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM students")
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM students").fetchone()[0]
 
 def get_today_attendance_count() -> int:
     """Get attendance count for today"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     today = datetime.date.today().isoformat()
-    cursor.execute("SELECT COUNT(DISTINCT student_id) FROM attendance WHERE date(timestamp) = ?", (today,))
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(DISTINCT student_id) FROM attendance WHERE date = ?",
+                            (today,)).fetchone()[0]
 
 def bulk_import_students(students_data: List[Dict]) -> Tuple[int, List[str]]:
     """Bulk import students from CSV data"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     success_count = 0
     errors = []
     
-    for idx, student in enumerate(students_data):
-        try:
-            name_val = student.get('name', '')
-            name = str(name_val).strip() if pd.notna(name_val) else ''
-            if not name:
-                errors.append(f"Row {idx + 1}: Name is required")
-                continue
-            
-            roll_val = student.get('roll_number', '')
-            roll_number = str(roll_val).strip() if pd.notna(roll_val) else ''
-            
-            class_val = student.get('class', '')
-            class_name = str(class_val).strip() if pd.notna(class_val) else ''
-            
-            section_val = student.get('section', '')
-            section = str(section_val).strip() if pd.notna(section_val) else ''
-            
-            reg_val = student.get('registration_number', '')
-            registration_number = str(reg_val).strip() if pd.notna(reg_val) else ''
-            
-            cursor.execute("SELECT id FROM students WHERE name = ? AND roll_number = ?", (name, roll_number))
-            if cursor.fetchone():
-                errors.append(f"Row {idx + 1}: Student '{name}' with roll number '{roll_number}' already exists")
-                continue
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        for idx, student in enumerate(students_data):
+            try:
+                name_val = student.get('name', '')
+                name = str(name_val).strip() if pd.notna(name_val) else ''
+                if not name:
+                    errors.append(f"Row {idx + 1}: Name is required")
+                    continue
+                
+                roll_val = student.get('roll_number', '')
+                roll_number = str(roll_val).strip() if pd.notna(roll_val) else ''
+                
+                class_val = student.get('class', '')
+                class_name = str(class_val).strip() if pd.notna(class_val) else ''
+                
+                section_val = student.get('section', '')
+                section = str(section_val).strip() if pd.notna(section_val) else ''
+                
+                reg_val = student.get('registration_number', '')
+                registration_number = str(reg_val).strip() if pd.notna(reg_val) else ''
+                
+                cursor.execute("SELECT id FROM students WHERE name = ? AND roll_number = ?", (name, roll_number))
+                if cursor.fetchone():
+                    errors.append(f"Row {idx + 1}: Student '{name}' with roll number '{roll_number}' already exists")
+                    continue
+                
+                created_at = datetime.datetime.now().isoformat()
+                cursor.execute("""
+                    INSERT INTO students (name, roll_number, class, section, registration_number, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (name, roll_number, class_name, section, registration_number, created_at))
+                
+                success_count += 1
             
-            created_at = datetime.datetime.now().isoformat()
-            cursor.execute("""
-                INSERT INTO students (name, roll_number, class, section, registration_number, created_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (name, roll_number, class_name, section, registration_number, created_at))
-            
-            success_count += 1
-            
-        except Exception as e:
-            errors.append(f"Row {idx + 1}: {str(e)}")
-    
-    conn.commit()
-    conn.close()
+            except Exception as e:
+                errors.append(f"Row {idx + 1}: {str(e)}")
     
     return success_count, errors
 
 def get_class_wise_attendance(period: str = "today") -> pd.DataFrame:
     """Get class-wise attendance statistics"""
-    conn = sqlite3.connect(DB_PATH)
-    
-    query = """
-        SELECT s.class, s.section, COUNT(DISTINCT a.student_id) as present,
-               (SELECT COUNT(*) FROM students WHERE class = s.class AND section = s.section) as total
-        FROM students s
-        LEFT JOIN attendance a ON s.id = a.student_id
-    """
-    
     if period == "today":
-        today = datetime.date.today().isoformat()
-        query += f" AND date(a.timestamp) = '{today}'"
-    elif period == "week":
-        week_ago = (datetime.date.today() - datetime.timedelta(days=7)).isoformat()
-        query += f" AND date(a.timestamp) >= '{week_ago}'"
-    elif period == "month":
-        month_ago = (datetime.date.today() - datetime.timedelta(days=30)).isoformat()
-        query += f" AND date(a.timestamp) >= '{month_ago}'"
-    
-    query += " GROUP BY s.class, s.section ORDER BY s.class, s.section"
-    
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+        query = """
+            SELECT c.class, c.section, IFNULL(d.present, 0) as present, c.total
+            FROM (
+                SELECT IFNULL(class, '') as class, IFNULL(section, '') as section, COUNT(*) as total
+                FROM students GROUP BY 1, 2
+            ) c
+            LEFT JOIN class_daily_attendance d
+                ON d.date = ? AND d.class = c.class AND d.section = c.section
+            ORDER BY c.class, c.section
+        """
+        params = (datetime.date.today().isoformat(),)
+    else:
+        condition, params = _period_filter(period, "t.last_seen")
+        query = f"""
+            SELECT IFNULL(s.class, '') as class, IFNULL(s.section, '') as section,
+                   COUNT(CASE WHEN {condition or 't.records > 0'} THEN 1 END) as present,
+                   COUNT(*) as total
+            FROM students s
+            LEFT JOIN student_attendance_totals t ON t.student_id = s.id
+            GROUP BY 1, 2 ORDER BY 1, 2
+        """
+    
+    with connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
     
     if not df.empty:
         df['attendance_rate'] = (df['present'] / df['total'] * 100).round(2)
@@ -279,20 +433,15 @@ def get_class_wise_attendance(period: str = "today") -> pd.DataFrame:
     return df
 
 def get_student_attendance_summary() -> pd.DataFrame:
-    """Get detailed attendance summary for all students"""
-    conn = sqlite3.connect(DB_PATH)
-    
+    """Get detailed attendance summary for all students (from the per-student rollup)"""
     query = """
         SELECT s.id, s.name, s.roll_number, s.class, s.section,
-               COUNT(a.id) as total_attendance,
-               MAX(a.timestamp) as last_attendance
+               IFNULL(t.records, 0) as total_attendance,
+               t.last_seen as last_attendance
         FROM students s
-        LEFT JOIN attendance a ON s.id = a.student_id
-        GROUP BY s.id
-        ORDER BY total_attendance DESC
+        LEFT JOIN student_attendance_totals t ON t.student_id = s.id
+        ORDER BY total_attendance DESC, s.id
     """
     
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    
-    return df
+    with connection() as conn:
+        return pd.read_sql_query(query, conn)
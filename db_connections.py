@@ -0,0 +1,98 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000))
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE_KIB = int(os.environ.get("DB_CACHE_SIZE_KIB", 16 * 1024))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 256 * 1024 * 1024))
+
+FileId = Optional[Tuple[int, int]]
+
+class SQLiteConnectionPool:
+    """Pool of long-lived SQLite connections shared across threads
+    
+    Each connection is opened once in WAL mode with the pragmas below, so
+    readers never block the writer and concurrent writers wait up to
+    busy_timeout instead of failing at once. A caller checks a connection out
+    for one unit of work; it is committed when the block succeeds, rolled
+    back when it raises and then returned to the pool. A connection whose
+    database file was deleted or replaced since it was opened is discarded
+    on checkout.
+    """
+    
+    def __init__(self, path: str, max_idle: int = DB_POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+    
+    def _file_id(self) -> FileId:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_dev, st.st_ino
+    
+    def _open(self) -> Tuple[sqlite3.Connection, FileId]:
+        conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        with self._lock:
+            self._opened += 1
+        return conn, self._file_id()
+    
+    def _acquire(self) -> Tuple[sqlite3.Connection, FileId]:
+        try:
+            conn, file_id = self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+        
+        if file_id != self._file_id():
+            conn.close()
+            return self._open()
+        return conn, file_id
+    
+    def _release(self, conn: sqlite3.Connection, file_id: FileId):
+        if self._closed:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait((conn, file_id))
+        except queue.Full:
+            conn.close()
+    
+    @contextmanager
+    def connection(self):
+        """Check out a connection; commits on success and rolls back on error"""
+        conn, file_id = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn, file_id)
+    
+    def close(self):
+        """Close every idle connection; connections in use close when returned"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+    
+    def stats(self) -> dict:
+        return {'path': self.path, 'opened': self._opened, 'idle': self._idle.qsize()}
\ No newline at end of file
@@ -0,0 +1,158 @@
+import os
+import hashlib
+import numpy as np
+from typing import Dict, Iterable, Optional, Tuple
+
+EMBEDDING_CACHE_PATH = "embedding_cache.npz"
+CACHE_FORMAT_VERSION = 1
+
+def file_digest(data: bytes) -> str:
+    """Content hash used to tell whether an image really changed"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class EmbeddingCache:
+    """On-disk cache of per-image face features used by train_model
+    
+    Entries are keyed by image path and validated against the file's size and
+    mtime; when those change the content hash decides whether the cached
+    features can still be used. Images in which no face was found are cached
+    too, so they are not run through detection again. The cache is stored as
+    plain NumPy arrays in a single .npz file, never as pickled objects.
+    """
+    
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, feature_size: int = 64 * 64,
+                 dtype=np.uint8):
+        self.path = path
+        self.feature_size = feature_size
+        self.dtype = np.dtype(dtype)
+        self._entries: Dict[str, Tuple[int, int, str, int, Optional[np.ndarray]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+    
+    @classmethod
+    def load(cls, path: str = EMBEDDING_CACHE_PATH, feature_size: int = 64 * 64,
+             dtype=np.uint8) -> "EmbeddingCache":
+        """Load the cache from disk, starting empty if it is missing or stale"""
+        cache = cls(path, feature_size, dtype)
+        if not os.path.exists(path):
+            return cache
+        
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                features = data['features']
+                if (int(data['version']) != CACHE_FORMAT_VERSION
+                        or features.shape[1:] != (feature_size,)
+                        or features.dtype != cache.dtype):
+                    return cache
+                
+                paths = data['paths']
+                sizes = data['sizes']
+                mtimes = data['mtimes']
+                digests = data['digests']
+                labels = data['labels']
+                has_face = data['has_face']
+        except (OSError, ValueError, KeyError):
+            return cache
+        
+        for i in range(len(paths)):
+            cache._entries[str(paths[i])] = (
+                int(sizes[i]), int(mtimes[i]), str(digests[i]), int(labels[i]),
+                features[i] if has_face[i] else None
+            )
+        
+        return cache
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __contains__(self, path: str) -> bool:
+        return path in self._entries
+    
+    def digest(self, path: str) -> Optional[str]:
+        """Return the recorded content hash for a path, if any"""
+        entry = self._entries.get(path)
+        return entry[2] if entry is not None else None
+    
+    def lookup(self, path: str, st: os.stat_result) -> Tuple[bool, Optional[np.ndarray]]:
+        """Return (True, features) if the entry matches the file's size and mtime
+        
+        features is None for a cached image without a detectable face.
+        """
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+            return False, None
+        
+        self.hits += 1
+        return True, entry[4]
+    
+    def lookup_digest(self, path: str, st: os.stat_result, digest: str) -> Tuple[bool, Optional[np.ndarray]]:
+        """Reuse an entry whose stat changed but whose content did not"""
+        entry = self._entries.get(path)
+        if entry is None or entry[2] != digest:
+            self.misses += 1
+            return False, None
+        
+        self._entries[path] = (st.st_size, st.st_mtime_ns, digest, entry[3], entry[4])
+        self.dirty = True
+        self.hits += 1
+        return True, entry[4]
+    
+    def store(self, path: str, st: os.stat_result, digest: str, label: int,
+              features: Optional[np.ndarray]):
+        """Record the features computed for an image (None if it has no face)"""
+        if features is not None:
+            features = np.asarray(features, dtype=self.dtype).reshape(self.feature_size)
+        
+        self._entries[path] = (st.st_size, st.st_mtime_ns, digest, int(label), features)
+        self.dirty = True
+    
+    def prune(self, keep_paths: Iterable[str]) -> int:
+        """Drop entries for images that no longer exist in the dataset"""
+        keep = set(keep_paths)
+        stale = [p for p in self._entries if p not in keep]
+        for p in stale:
+            del self._entries[p]
+        
+        if stale:
+            self.dirty = True
+        return len(stale)
+    
+    def drop_label(self, label: int) -> int:
+        """Drop every entry belonging to one student"""
+        stale = [p for p, entry in self._entries.items() if entry[3] == int(label)]
+        for p in stale:
+            del self._entries[p]
+        
+        if stale:
+            self.dirty = True
+        return len(stale)
+    
+    def save(self):
+        """Write the cache atomically (temp file then rename)"""
+        paths = list(self._entries)
+        count = len(paths)
+        
+        features = np.zeros((count, self.feature_size), dtype=self.dtype)
+        has_face = np.zeros(count, dtype=bool)
+        for i, p in enumerate(paths):
+            row = self._entries[p][4]
+            if row is not None:
+                features[i] = row
+                has_face[i] = True
+        
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                version=np.array(CACHE_FORMAT_VERSION),
+                paths=np.array(paths, dtype=str),
+                sizes=np.array([self._entries[p][0] for p in paths], dtype=np.int64),
+                mtimes=np.array([self._entries[p][1] for p in paths], dtype=np.int64),
+                digests=np.array([self._entries[p][2] for p in paths], dtype=str),
+                labels=np.array([self._entries[p][3] for p in paths], dtype=np.int64),
+                has_face=has_face,
+                features=features
+            )
+        os.replace(tmp_path, self.path)
+        self.dirty = False
@@ -0,0 +1,136 @@
+import os
+import time
+import cv2
+import numpy as np
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from face_recognition_model import DETECT_ROI, BBox, FaceRegion, detect_face_with_pose, embed_face
+
+ENROLL_MIN_SHARPNESS = float(os.environ.get("ENROLL_MIN_SHARPNESS", 50))
+ENROLL_MIN_FACE_FRACTION = float(os.environ.get("ENROLL_MIN_FACE_FRACTION", 0.15))
+ENROLL_MIN_HASH_DISTANCE = int(os.environ.get("ENROLL_MIN_HASH_DISTANCE", 8))
+ENROLL_MIN_POSE_DELTA = float(os.environ.get("ENROLL_MIN_POSE_DELTA", 0.08))
+ENROLL_TIMEOUT = float(os.environ.get("ENROLL_TIMEOUT", 20))
+
+class EnrollmentFrame(NamedTuple):
+    image: np.ndarray
+    face: np.ndarray
+    bbox: BBox
+    pose: Tuple[float, float]
+    sharpness: float
+    face_hash: int
+    embedding: np.ndarray
+
+def sharpness(face: np.ndarray) -> float:
+    """Variance of the Laplacian of a grey crop; low values mean a blurry face"""
+    return float(cv2.Laplacian(face, cv2.CV_64F).var())
+
+def face_hash(face: np.ndarray) -> int:
+    """64-bit difference hash of a grey crop, for spotting near-identical captures"""
+    small = cv2.resize(face, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+class EnrollmentGate:
+    """Frame-by-frame quality and redundancy check for registration captures
+    
+    evaluate() runs detection once on a frame and accepts it only if a face
+    is present, wide enough relative to the frame, sharp enough, and not a
+    near-duplicate of a frame already accepted. A frame is a duplicate when
+    some accepted frame has both a similar face hash (fewer than
+    min_hash_distance differing bits) and a similar pose, so turning the
+    head or changing expression both count as new views. Capture stops once
+    `target` frames are accepted. With DETECT_ROI set, detection searches
+    near the previous face first.
+    """
+    
+    def __init__(self, target: int = 10, min_sharpness: float = ENROLL_MIN_SHARPNESS,
+                 min_face_fraction: float = ENROLL_MIN_FACE_FRACTION,
+                 min_hash_distance: int = ENROLL_MIN_HASH_DISTANCE,
+                 min_pose_delta: float = ENROLL_MIN_POSE_DELTA):
+        self.target = target
+        self.min_sharpness = min_sharpness
+        self.min_face_fraction = min_face_fraction
+        self.min_hash_distance = min_hash_distance
+        self.min_pose_delta = min_pose_delta
+        self.region = FaceRegion() if DETECT_ROI else None
+        self.accepted: List[EnrollmentFrame] = []
+        self.rejected: Dict[str, int] = {}
+        self.frames = 0
+    
+    @property
+    def done(self) -> bool:
+        return len(self.accepted) >= self.target
+    
+    def _reject(self, reason: str) -> Tuple[Optional[EnrollmentFrame], str]:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return None, reason
+    
+    def _is_duplicate(self, phash: int, pose: Tuple[float, float]) -> bool:
+        for frame in self.accepted:
+            similar_face = (phash ^ frame.face_hash).bit_count() < self.min_hash_distance
+            similar_pose = max(abs(pose[0] - frame.pose[0]), abs(pose[1] - frame.pose[1])) < self.min_pose_delta
+            if similar_face and similar_pose:
+                return True
+        return False
+    
+    def evaluate(self, image: np.ndarray) -> Tuple[Optional[EnrollmentFrame], str]:
+        """Accept or reject one frame; returns (frame or None, "accepted" or the rejection reason)"""
+        self.frames += 1
+        found = detect_face_with_pose(image, self.region)
+        if found is None:
+            return self._reject("no_face")
+        
+        face, bbox, pose = found
+        if bbox[2] - bbox[0] < self.min_face_fraction * image.shape[1]:
+            return self._reject("too_small")
+        
+        score = sharpness(face)
+        if score < self.min_sharpness:
+            return self._reject("blurry")
+        
+        phash = face_hash(face)
+        if self._is_duplicate(phash, pose):
+            return self._reject("duplicate")
+        
+        frame = EnrollmentFrame(image, face, bbox, pose, score, phash, embed_face(face))
+        self.accepted.append(frame)
+        return frame, "accepted"
+    
+    def pose_spread(self) -> Tuple[float, float]:
+        """Range of yaw and pitch covered by the accepted frames"""
+        if not self.accepted:
+            return 0.0, 0.0
+        poses = np.array([frame.pose for frame in self.accepted])
+        spread = poses.max(axis=0) - poses.min(axis=0)
+        return float(spread[0]), float(spread[1])
+    
+    def stats(self) -> dict:
+        yaw, pitch = self.pose_spread()
+        return {
+            'frames': self.frames,
+            'accepted': len(self.accepted),
+            'rejected': dict(self.rejected),
+            'yaw_spread': round(yaw, 3),
+            'pitch_spread': round(pitch, 3),
+        }
+
+def capture_enrollment(read_frame: Callable[[], Optional[np.ndarray]], gate: EnrollmentGate,
+                       timeout: float = ENROLL_TIMEOUT,
+                       on_frame: Optional[Callable[[np.ndarray, Optional[EnrollmentFrame], str], None]] = None
+                       ) -> List[EnrollmentFrame]:
+    """Evaluate camera frames as they arrive until the gate is satisfied or timeout seconds pass
+    
+    read_frame returns the next BGR frame, or None when the camera fails.
+    on_frame, if given, is called with every frame and its verdict so the
+    caller can show live feedback.
+    """
+    deadline = time.monotonic() + timeout
+    while not gate.done and time.monotonic() < deadline:
+        image = read_frame()
+        if image is None:
+            break
+        accepted, verdict = gate.evaluate(image)
+        if on_frame is not None:
+            on_frame(image, accepted, verdict)
+    return gate.accepted
\ No newline at end of file
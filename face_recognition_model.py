@@ -4,165 +4,895 @@ import numpy as np
 import pickle
 from sklearn.ensemble import RandomForestClassifier
 import mediapipe as mp
-from typing import Optional, Tuple, Callable
+from typing import Optional, Tuple, Callable, List, Dict
 import io
+import fcntl
+import atexit
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from embedding_cache import EmbeddingCache, EMBEDDING_CACHE_PATH, file_digest
+from gallery import GalleryMatcher
+from ann_index import IVFPQIndex
+from projection import PROJECTIONS, ProjectedModel, fit_projection
+from face_tracker import FaceTracker
+from micro_batcher import MicroBatcher
+from latency_metrics import span, count
+from face_shards import FaceShardStore
+from model_bundle import MODEL_DIR, bundle_exists, bundle_signature, load_bundle, read_manifest, save_bundle
 
-MODEL_PATH = "face_model.pkl"
+MODEL_PATH = "face_model.pkl"  # legacy single-pickle model, still readable
 DATASET_DIR = "dataset"
+FACE_SIZE = (64, 64)
+BBox = Tuple[int, int, int, int]
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+TRAIN_WORKERS = int(os.environ.get("TRAIN_WORKERS", os.cpu_count() or 1))
+INGEST_CHUNK_SIZE = 32
+TRAIN_CHECKPOINT_SECONDS = float(os.environ.get("TRAIN_CHECKPOINT_SECONDS", 30))
+RECOGNITION_ENGINES = ("random_forest", "gallery", "ann")
+RECOGNITION_ENGINE = os.environ.get("RECOGNITION_ENGINE", "random_forest")
+PROJECTION = os.environ.get("FACE_PROJECTION", "none")
+DATASET_STORAGE = os.environ.get("DATASET_STORAGE", "images")  # "images" or "shards"
+KEEP_ORIGINAL_FRAMES = os.environ.get("KEEP_ORIGINAL_FRAMES", "0").lower() not in ("", "0", "false", "no")
+PREDICT_BATCH_SIZE = int(os.environ.get("PREDICT_BATCH_SIZE", 32))
+PREDICT_BATCH_WAIT_MS = float(os.environ.get("PREDICT_BATCH_WAIT_MS", 2))
 
 os.makedirs(DATASET_DIR, exist_ok=True)
 
 mp_face_detection = mp.solutions.face_detection
 
-def crop_face_and_embed(bgr_image: np.ndarray, detection) -> Optional[np.ndarray]:
-    """Extract face from image and create embedding"""
-    h, w = bgr_image.shape[:2]
+DETECTOR_MODEL_SELECTION = 1
+DETECTOR_MIN_CONFIDENCE = 0.5
+DETECT_MAX_SIDE = int(os.environ.get("DETECT_MAX_SIDE", 640))  # 0 detects at full resolution
+DETECT_ROI = os.environ.get("DETECT_ROI", "0").lower() not in ("", "0", "false", "no")  # enrollment only
+ROI_MARGIN = float(os.environ.get("ROI_MARGIN", 1.0))
+
+class FaceDetectorPool:
+    """Pool of long-lived MediaPipe face detectors shared across threads
+    
+    A MediaPipe graph must not be used from two threads at once, so each
+    caller checks a detector out for the duration of its work. Detectors are
+    created lazily, warmed up once and kept for reuse, which avoids paying the
+    graph setup cost on every frame.
+    """
+    
+    def __init__(self, model_selection: int = DETECTOR_MODEL_SELECTION,
+                 min_detection_confidence: float = DETECTOR_MIN_CONFIDENCE,
+                 max_idle: int = 4):
+        self.model_selection = model_selection
+        self.min_detection_confidence = min_detection_confidence
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+    
+    def _create(self):
+        detector = mp_face_detection.FaceDetection(
+            model_selection=self.model_selection,
+            min_detection_confidence=self.min_detection_confidence
+        )
+        detector.process(np.zeros((64, 64, 3), dtype=np.uint8))
+        with self._lock:
+            self._created += 1
+        return detector
+    
+    @contextmanager
+    def acquire(self):
+        """Check out a detector, returning it to the pool afterwards"""
+        try:
+            detector = self._idle.get_nowait()
+        except queue.Empty:
+            detector = self._create()
+        
+        try:
+            yield detector
+        finally:
+            self._release(detector)
+    
+    def _release(self, detector):
+        if not self._closed:
+            try:
+                self._idle.put_nowait(detector)
+                return
+            except queue.Full:
+                pass
+        detector.close()
+    
+    def close(self):
+        """Close all idle detectors; checked-out ones close on release"""
+        self._closed = True
+        while True:
+            try:
+                detector = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            detector.close()
+    
+    def stats(self) -> dict:
+        """Return the number of detectors created and currently idle"""
+        return {'created': self._created, 'idle': self._idle.qsize()}
+
+_detector_pool = FaceDetectorPool()
+
+def face_detector():
+    """Context manager yielding a warmed-up detector from the shared pool"""
+    return _detector_pool.acquire()
+
+def close_face_detectors():
+    """Release the shared detectors (called automatically at exit)"""
+    _detector_pool.close()
+
+atexit.register(close_face_detectors)
+
+def detection_bbox(detection, width: int, height: int) -> Optional[BBox]:
+    """Pixel (x1, y1, x2, y2) box of a detection, clipped to the image"""
     bbox = detection.location_data.relative_bounding_box
     
-    x1 = int(max(0, bbox.xmin * w))
-    y1 = int(max(0, bbox.ymin * h))
-    x2 = int(min(w, (bbox.xmin + bbox.width) * w))
-    y2 = int(min(h, (bbox.ymin + bbox.height) * h))
+    x1 = int(max(0, bbox.xmin * width))
+    y1 = int(max(0, bbox.ymin * height))
+    x2 = int(min(width, (bbox.xmin + bbox.width) * width))
+    y2 = int(min(height, (bbox.ymin + bbox.height) * height))
     
     if x2 <= x1 or y2 <= y1:
         return None
     
-    face = bgr_image[y1:y2, x1:x2]
-    face_gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
-    face_resized = cv2.resize(face_gray, (64, 64), interpolation=cv2.INTER_AREA)
-    embedding = face_resized.flatten().astype(np.float32) / 255.0
+    return x1, y1, x2, y2
+
+def crop_face(bgr_image: np.ndarray, detection) -> Optional[np.ndarray]:
+    """Crop the detected face and return it as a 64x64 grey uint8 image"""
+    h, w = bgr_image.shape[:2]
+    bbox = detection_bbox(detection, w, h)
+    if bbox is None:
+        return None
+    
+    return crop_bbox(bgr_image, bbox)
+
+def crop_bbox(bgr_image: np.ndarray, bbox: BBox) -> np.ndarray:
+    """Crop a pixel box and return it as a 64x64 grey uint8 image"""
+    x1, y1, x2, y2 = bbox
+    with span("embed.crop_resize"):
+        face = bgr_image[y1:y2, x1:x2]
+        face_gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(face_gray, FACE_SIZE, interpolation=cv2.INTER_AREA)
+
+def embed_face(face: np.ndarray) -> np.ndarray:
+    """Turn a grey face crop into the float embedding used by the classifier"""
+    return face.flatten().astype(np.float32) / 255.0
+
+def crop_face_and_embed(bgr_image: np.ndarray, detection) -> Optional[np.ndarray]:
+    """Extract face from image and create embedding"""
+    face = crop_face(bgr_image, detection)
+    if face is None:
+        return None
+    
+    return embed_face(face)
+
+_detect_buffers = threading.local()
+
+def _detect_buffer(name: str, shape: Tuple[int, int, int]) -> np.ndarray:
+    """View of the given shape into a per-thread scratch buffer, grown only when too small"""
+    size = shape[0] * shape[1] * shape[2]
+    buffer = getattr(_detect_buffers, name, None)
+    if buffer is None or buffer.size < size:
+        buffer = np.empty(max(size, DETECT_MAX_SIDE * DETECT_MAX_SIDE * 3), dtype=np.uint8)
+        setattr(_detect_buffers, name, buffer)
+    return buffer[:size].reshape(shape)
+
+def _detection_input(image: np.ndarray) -> np.ndarray:
+    """RGB copy of a BGR image for the detector, downscaled so its longer side is at most DETECT_MAX_SIDE
+    
+    The resize and colour conversion write into views of per-thread buffers
+    sized for a DETECT_MAX_SIDE square, so full frames and ROI windows of
+    any size reuse the same memory. MediaPipe reports boxes relative to the
+    image, so they map straight back onto the full-resolution frame, which
+    the crop is taken from.
+    """
+    h, w = image.shape[:2]
+    scale = DETECT_MAX_SIDE / max(h, w) if DETECT_MAX_SIDE > 0 else 1.0
+    
+    if scale < 1:
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        small = _detect_buffer('small', (size[1], size[0], 3))
+        with span("detect.downscale"):
+            cv2.resize(image, size, dst=small, interpolation=cv2.INTER_LINEAR)
+        image = small
+    rgb = _detect_buffer('rgb', image.shape)
+    with span("detect.bgr_to_rgb"):
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=rgb)
+    return rgb
+
+def _run_detector(image: np.ndarray):
+    """Run MediaPipe face detection on a BGR image"""
+    with face_detector() as face_detection:
+        rgb_image = _detection_input(image)
+        with span("detect.mediapipe"):
+            return face_detection.process(rgb_image)
+
+def detect_face_crop(image: np.ndarray) -> Optional[np.ndarray]:
+    """Detect the first face in a BGR image and return its grey crop"""
+    results = _run_detector(image)
+    if not results.detections:
+        count("faces.missed")
+        return None
+    
+    count("faces.found")
+    return crop_face(image, results.detections[0])
+
+def detection_pose(detection) -> Tuple[float, float]:
+    """Rough (yaw, pitch) of a detection from its eye, nose and mouth keypoints
+    
+    Both are about 0 for a frontal face. Yaw is the nose offset from the eye
+    midpoint in eye distances; pitch is the nose position between the eyes
+    and the mouth, relative to halfway.
+    """
+    points = detection.location_data.relative_keypoints
+    if len(points) < 4:
+        return 0.0, 0.0
+    
+    right_eye, left_eye, nose, mouth = points[:4]
+    eye_x = (right_eye.x + left_eye.x) / 2
+    eye_y = (right_eye.y + left_eye.y) / 2
+    yaw = (nose.x - eye_x) / max(abs(left_eye.x - right_eye.x), 1e-6)
+    pitch = (nose.y - eye_y) / max(mouth.y - eye_y, 1e-6) - 0.5
+    return float(yaw), float(pitch)
+
+class FaceRegion:
+    """Last face box of a single-person stream, for detecting in a window around it
+    
+    window() is the previous box grown by `margin` face sizes on every side.
+    Only the window is converted for the detector, and the face fills more
+    of the detector's fixed-size input; when no face is found in the window
+    the whole frame is searched again. Only enrollment capture uses it:
+    attendance has to find every face, so it always searches the full frame.
+    """
+    
+    def __init__(self, margin: float = ROI_MARGIN):
+        self.margin = margin
+        self.bbox: Optional[BBox] = None
+    
+    def window(self, width: int, height: int) -> Optional[BBox]:
+        if self.bbox is None:
+            return None
+        x1, y1, x2, y2 = self.bbox
+        dx = int((x2 - x1) * self.margin)
+        dy = int((y2 - y1) * self.margin)
+        return max(0, x1 - dx), max(0, y1 - dy), min(width, x2 + dx), min(height, y2 + dy)
+    
+    def update(self, bbox: Optional[BBox]):
+        self.bbox = bbox
+
+def _locate_first_face(image: np.ndarray, window: Optional[BBox] = None
+                       ) -> Optional[Tuple[BBox, Tuple[float, float]]]:
+    """Pixel bbox and pose of the first face in the image, or in a window of it"""
+    x0, y0 = 0, 0
+    if window is not None:
+        x0, y0, x1, y1 = window
+        image = image[y0:y1, x0:x1]
+    
+    results = _run_detector(image)
+    if not results.detections:
+        return None
+    
+    detection = results.detections[0]
+    h, w = image.shape[:2]
+    bbox = detection_bbox(detection, w, h)
+    if bbox is None:
+        return None
+    return (bbox[0] + x0, bbox[1] + y0, bbox[2] + x0, bbox[3] + y0), detection_pose(detection)
+
+def detect_face_with_pose(image: np.ndarray, region: Optional[FaceRegion] = None
+                          ) -> Optional[Tuple[np.ndarray, BBox, Tuple[float, float]]]:
+    """Detect the first face in a BGR image, returning its grey crop, pixel bbox and (yaw, pitch)
+    
+    With a region, the window around the previous face is searched first
+    and the region is moved to the face found.
+    """
+    located = None
+    window = region.window(image.shape[1], image.shape[0]) if region is not None else None
+    if window is not None:
+        located = _locate_first_face(image, window)
+        count("detect.roi_hits" if located is not None else "detect.roi_misses")
+    if located is None:
+        located = _locate_first_face(image)
+    if region is not None:
+        region.update(located[0] if located is not None else None)
+    
+    if located is None:
+        count("faces.missed")
+        return None
+    
+    count("faces.found")
+    bbox, pose = located
+    return crop_bbox(image, bbox), bbox, pose
+
+def detect_face_with_box(image: np.ndarray, region: Optional[FaceRegion] = None
+                         ) -> Optional[Tuple[np.ndarray, BBox]]:
+    """Detect the first face in a BGR image, returning its grey crop and pixel bbox"""
+    found = detect_face_with_pose(image, region)
+    return found[:2] if found is not None else None
+
+def detect_face_boxes(image: np.ndarray) -> List[BBox]:
+    """Detect every face in a BGR image and return their pixel boxes"""
+    results = _run_detector(image)
+    if not results.detections:
+        count("faces.missed")
+        return []
+    
+    count("faces.found", len(results.detections))
     
-    return embedding
+    h, w = image.shape[:2]
+    boxes = [detection_bbox(detection, w, h) for detection in results.detections]
+    return [bbox for bbox in boxes if bbox is not None]
+
+def detect_faces(image: np.ndarray) -> List[Tuple[np.ndarray, BBox]]:
+    """Detect every face in a BGR image, returning (grey crop, pixel bbox) pairs"""
+    return [(crop_bbox(image, bbox), bbox) for bbox in detect_face_boxes(image)]
 
 def extract_face_embedding(image: np.ndarray) -> Optional[np.ndarray]:
     """Extract face embedding from an image"""
-    with mp_face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.5) as face_detection:
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        results = face_detection.process(rgb_image)
-        
-        if not results.detections:
-            return None
-        
-        embedding = crop_face_and_embed(image, results.detections[0])
-        return embedding
+    face = detect_face_crop(image)
+    if face is None:
+        return None
+    
+    return embed_face(face)
+
+_shard_store = FaceShardStore()
+
+def sidecar_path(image_path: str) -> str:
+    """Path of the enrollment sidecar (bbox and face crop) stored next to a dataset image"""
+    return os.path.splitext(image_path)[0] + ".npz"
+
+def _write_sidecar(image_path: str, digest: str, face: np.ndarray, bbox: Optional[BBox]):
+    path = sidecar_path(image_path)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, digest=np.array(digest), face=np.asarray(face, dtype=np.uint8),
+                 bbox=np.array(bbox if bbox is not None else (-1, -1, -1, -1), dtype=np.int32))
+    os.replace(tmp_path, path)
+
+def _read_sidecar(image_path: str, digest: str) -> Optional[np.ndarray]:
+    """Face crop saved at registration, if it still matches the image content"""
+    try:
+        with np.load(sidecar_path(image_path), allow_pickle=False) as data:
+            if str(data['digest']) != digest or data['face'].shape != FACE_SIZE:
+                return None
+            return data['face']
+    except (OSError, ValueError, KeyError):
+        return None
 
-def save_face_image(student_id: int, image: np.ndarray, image_index: int) -> str:
+def save_face_image(student_id: int, image: np.ndarray, image_index: int,
+                    face: Optional[np.ndarray] = None, bbox: Optional[BBox] = None) -> str:
     """Save face image to dataset folder"""
     student_folder = os.path.join(DATASET_DIR, str(student_id))
-    os.makedirs(student_folder, exist_ok=True)
-    
     filename = f"face_{image_index}.jpg"
     filepath = os.path.join(student_folder, filename)
-    cv2.imwrite(filepath, image)
+    
+    if DATASET_STORAGE == "shards":
+        if face is None:
+            face = detect_face_crop(image)
+        if face is not None:
+            _shard_store.append(student_id, face[np.newaxis], [filepath])
+        if not KEEP_ORIGINAL_FRAMES:
+            return filepath
+    
+    os.makedirs(student_folder, exist_ok=True)
+    ok, encoded = cv2.imencode('.jpg', image)
+    if not ok:
+        raise ValueError(f"Could not encode image for {filepath}")
+    data = encoded.tobytes()
+    with open(filepath, 'wb') as f:
+        f.write(data)
+    if face is not None:
+        _write_sidecar(filepath, file_digest(data), face, bbox)
     
     return filepath
 
-def train_model(progress_callback: Optional[Callable] = None) -> bool:
+def enroll_face_image(student_id: int, image: np.ndarray, image_index: int) -> Optional[np.ndarray]:
+    """Detect, store and embed one registration image in a single detector pass
+    
+    Returns the embedding, or None (and stores nothing) if no face is found.
+    """
+    found = detect_face_with_box(image)
+    if found is None:
+        return None
+    
+    face, bbox = found
+    save_face_image(student_id, image, image_index, face=face, bbox=bbox)
+    return embed_face(face)
+
+def _ingest_image(img_path: str, known_digest: Optional[str] = None):
+    """Read, hash and detect one dataset image; also runs inside pool workers
+    
+    If the content hash equals known_digest the image is unchanged and
+    detection is skipped, and a matching registration sidecar supplies the
+    crop without detecting. Returns (path, stat, digest, unchanged, face).
+    """
+    try:
+        st = os.stat(img_path)
+        with open(img_path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return img_path, None, None, False, None
+    
+    digest = file_digest(data)
+    if digest == known_digest:
+        return img_path, st, digest, True, None
+    
+    face = _read_sidecar(img_path, digest)
+    if face is None:
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        face = detect_face_crop(image) if image is not None else None
+    return img_path, st, digest, False, face
+
+def _ingest_chunk(items: List[Tuple[str, Optional[str]]]) -> list:
+    """Ingest a chunk of (path, known digest) pairs"""
+    return [_ingest_image(path, digest) for path, digest in items]
+
+def _init_ingest_worker():
+    """Keep each worker's OpenCV single-threaded; the pool provides the parallelism"""
+    cv2.setNumThreads(1)
+
+class TrainingCancelled(Exception):
+    """Raised by train_model when its should_cancel callback returns True"""
+
+def collect_face_crops(students: List[Tuple[int, List[str]]], cache: EmbeddingCache,
+                       workers: int = TRAIN_WORKERS,
+                       progress_callback: Optional[Callable] = None,
+                       should_cancel: Optional[Callable[[], bool]] = None) -> Dict[str, Optional[np.ndarray]]:
+    """Return the face crop for every dataset image, keyed by path
+    
+    Cache hits are resolved here from a stat call alone. The remaining images
+    are split into chunks and decoded, hashed and detected either inline or,
+    when there are enough of them, across a pool of worker processes that each
+    hold their own detector. Progress covers 0-80% as in train_model.
+    
+    Finished work is checkpointed to the cache file every
+    TRAIN_CHECKPOINT_SECONDS, and should_cancel is polled after each chunk
+    (raising TrainingCancelled), so an interrupted run resumes from the cache.
+    """
+    labels = {}
+    faces = {}
+    pending = []
+    
+    for student_id, image_paths in students:
+        for img_path in image_paths:
+            labels[img_path] = student_id
+            try:
+                st = os.stat(img_path)
+            except OSError:
+                continue
+            
+            hit, face = cache.lookup(img_path, st)
+            if hit:
+                faces[img_path] = face
+            else:
+                pending.append((img_path, cache.digest(img_path)))
+    
+    total = len(labels)
+    done = total - len(pending)
+    last_checkpoint = time.monotonic()
+    
+    def report():
+        nonlocal last_checkpoint
+        if progress_callback and total:
+            progress_callback(int(done / total * 80), f"Processing image {done}/{total}")
+        if cache.dirty and time.monotonic() - last_checkpoint >= TRAIN_CHECKPOINT_SECONDS:
+            cache.save()
+            last_checkpoint = time.monotonic()
+        if should_cancel and should_cancel():
+            raise TrainingCancelled()
+    
+    def absorb(results):
+        for img_path, st, digest, unchanged, face in results:
+            if st is None:
+                continue
+            if unchanged:
+                _, face = cache.lookup_digest(img_path, st, digest)
+            else:
+                cache.store(img_path, st, digest, labels[img_path], face)
+            faces[img_path] = face
+    
+    report()
+    chunks = [pending[i:i + INGEST_CHUNK_SIZE] for i in range(0, len(pending), INGEST_CHUNK_SIZE)]
+    
+    if workers > 1 and len(chunks) > 1:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context,
+                                 initializer=_init_ingest_worker) as executor:
+            futures = [executor.submit(_ingest_chunk, chunk) for chunk in chunks]
+            try:
+                for future in as_completed(futures):
+                    results = future.result()
+                    absorb(results)
+                    done += len(results)
+                    report()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    else:
+        for chunk in chunks:
+            absorb(_ingest_chunk(chunk))
+            done += len(chunk)
+            report()
+    
+    return faces
+
+def list_dataset_images() -> List[Tuple[int, List[str]]]:
+    """List (student_id, image paths) for every student folder in the dataset"""
+    students = []
+    for student_id in os.listdir(DATASET_DIR):
+        folder_path = os.path.join(DATASET_DIR, student_id)
+        if not os.path.isdir(folder_path):
+            continue
+        
+        image_files = [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path))
+                       if f.lower().endswith(IMAGE_EXTENSIONS)]
+        students.append((int(student_id), image_files))
+    
+    return students
+
+def fit_engine(X: np.ndarray, y: np.ndarray, engine: str):
+    """Fit the selected recognition engine on embeddings X and labels y"""
+    if engine == "gallery":
+        return GalleryMatcher.from_embeddings(X, y)
+    if engine == "ann":
+        return IVFPQIndex.build(X, y)
+    
+    classifier = RandomForestClassifier(
+        n_estimators=100,
+        max_depth=15,
+        random_state=42,
+        n_jobs=-1
+    )
+    classifier.fit(X, y)
+    return classifier
+
+def train_model(progress_callback: Optional[Callable] = None, workers: int = TRAIN_WORKERS,
+                engine: Optional[str] = None, projection: Optional[str] = None,
+                should_cancel: Optional[Callable[[], bool]] = None) -> bool:
     """Train face recognition model"""
+    engine = engine or RECOGNITION_ENGINE
+    if engine not in RECOGNITION_ENGINES:
+        raise ValueError(f"Unknown recognition engine: {engine}")
+    projection = projection or PROJECTION
+    if projection not in PROJECTIONS:
+        raise ValueError(f"Unknown projection: {projection}")
+    
+    started = time.perf_counter()
     if progress_callback:
         progress_callback(0, "Starting training...")
     
-    with mp_face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.5) as face_detection:
-        X = []
-        y = []
-        
-        student_dirs = [d for d in os.listdir(DATASET_DIR) 
-                       if os.path.isdir(os.path.join(DATASET_DIR, d))]
-        
-        if not student_dirs:
-            if progress_callback:
-                progress_callback(0, "No training data found")
-            return False
-        
-        total_students = len(student_dirs)
-        
-        for idx, student_id in enumerate(student_dirs):
-            folder_path = os.path.join(DATASET_DIR, student_id)
-            image_files = [f for f in os.listdir(folder_path) 
-                          if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-            
-            for img_file in image_files:
-                img_path = os.path.join(folder_path, img_file)
-                image = cv2.imread(img_path)
-                
-                if image is None:
-                    continue
-                
-                rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                results = face_detection.process(rgb_image)
-                
-                if not results.detections:
-                    continue
-                
-                embedding = crop_face_and_embed(image, results.detections[0])
-                if embedding is None:
-                    continue
-                
-                X.append(embedding)
-                y.append(int(student_id))
-            
-            if progress_callback:
-                progress = int((idx + 1) / total_students * 80)
-                progress_callback(progress, f"Processing student {idx + 1}/{total_students}")
-        
-        if len(X) == 0:
-            if progress_callback:
-                progress_callback(0, "No valid training data found")
-            return False
-        
+    X = []
+    y = []
+    
+    students = list_dataset_images()
+    shard_labels, shard_keys, shard_faces = _shard_store.load()
+    if shard_keys:
+        stored = set(shard_keys)
+        students = [(student_id, [p for p in paths if p not in stored]) for student_id, paths in students]
+    
+    if not students and not len(shard_labels):
         if progress_callback:
-            progress_callback(85, "Training model...")
-        
-        X = np.array(X)
-        y = np.array(y)
-        
-        classifier = RandomForestClassifier(
-            n_estimators=100,
-            max_depth=15,
-            random_state=42,
-            n_jobs=-1
-        )
-        classifier.fit(X, y)
-        
-        with open(MODEL_PATH, 'wb') as f:
-            pickle.dump(classifier, f)
-        
+            progress_callback(0, "No training data found")
+        return False
+    
+    cache = EmbeddingCache.load(EMBEDDING_CACHE_PATH)
+    try:
+        faces = collect_face_crops(students, cache, workers, progress_callback, should_cancel)
+    except BaseException:
+        if cache.dirty:
+            cache.save()
+        raise
+    
+    for student_id, image_paths in students:
+        for img_path in image_paths:
+            face = faces.get(img_path)
+            if face is None:
+                continue
+            
+            X.append(embed_face(face))
+            y.append(student_id)
+    
+    X.extend(embed_face(face) for face in shard_faces)
+    y.extend(int(label) for label in shard_labels)
+    
+    cache.prune(faces)
+    if cache.dirty:
+        cache.save()
+    
+    if len(X) == 0:
         if progress_callback:
-            progress_callback(100, "Training complete!")
-        
-        return True
+            progress_callback(0, "No valid training data found")
+        return False
+    
+    if should_cancel and should_cancel():
+        raise TrainingCancelled()
+    
+    if progress_callback:
+        progress_callback(85, "Training model...")
+    
+    X = np.array(X)
+    y = np.array(y)
+    
+    projected = None
+    projector = fit_projection(X, y, projection)
+    if projector is not None:
+        projected = ProjectedModel.from_pipeline(projector, None)
+        X = projected.transform(X)
+    
+    classifier = fit_engine(X, y, engine)
+    if projected is not None:
+        projected.model = classifier
+        classifier = projected
+    
+    if should_cancel and should_cancel():
+        raise TrainingCancelled()
+    
+    save_model(classifier, {
+        'engine': engine,
+        'projection': projection,
+        'n_samples': int(len(y)),
+        'n_students': int(len(np.unique(y))),
+        'n_features': int(FACE_SIZE[0] * FACE_SIZE[1]),
+        'train_seconds': round(time.perf_counter() - started, 3)
+    })
+    
+    if progress_callback:
+        progress_callback(100, "Training complete!")
+    
+    return True
 
-def load_model() -> Optional[RandomForestClassifier]:
-    """Load trained model"""
+def _model_signature() -> Optional[tuple]:
+    """Cheap signature of the model on disk: the bundle pointer, else the legacy pickle"""
+    signature = bundle_signature(MODEL_DIR)
+    if signature is not None:
+        return ('bundle',) + signature
+    
+    try:
+        st = os.stat(MODEL_PATH)
+    except FileNotFoundError:
+        return None
+    return ('pickle', st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _read_model():
+    """Open the model bundle lazily, falling back to a legacy face_model.pkl"""
+    if bundle_exists(MODEL_DIR):
+        return load_bundle(MODEL_DIR)
+    
     if not os.path.exists(MODEL_PATH):
         return None
     
     with open(MODEL_PATH, 'rb') as f:
         return pickle.load(f)
 
+class ModelHolder:
+    """Process-wide cache of the trained model with hot reload
+    
+    Each call to get() only stats the bundle's CURRENT pointer (or the legacy
+    pickle); the model is opened again only when its inode, mtime or size
+    changes. The (signature, model) pair is swapped as a single reference, so
+    a prediction that already holds the old model keeps using it until it
+    finishes.
+    """
+    
+    def __init__(self):
+        self._state = (None, None)
+        self._lock = threading.Lock()
+    
+    def get(self):
+        """Return the current model, reloading it if it changed on disk"""
+        signature, model = self._state
+        current = _model_signature()
+        if current == signature:
+            return model
+        
+        with self._lock:
+            signature, model = self._state
+            current = _model_signature()
+            if current != signature:
+                with span("model.reload"):
+                    model = _read_model() if current is not None else None
+                self._state = (current, model)
+            return model
+    
+    def publish(self, model):
+        """Install a model that was just written to disk without re-reading it"""
+        with self._lock:
+            self._state = (_model_signature(), model)
+    
+    def invalidate(self):
+        """Forget the cached model so the next get() reloads from disk"""
+        with self._lock:
+            self._state = (None, None)
+
+_model_holder = ModelHolder()
+
+def save_model(model, training_stats: Optional[dict] = None) -> str:
+    """Publish a model as a new bundle version and install it in this process
+    
+    When training_stats is None the stats of the current version are kept,
+    which is what incremental gallery updates want.
+    """
+    if training_stats is None:
+        manifest = read_manifest(MODEL_DIR)
+        training_stats = manifest['training_stats'] if manifest else {}
+    
+    version = save_bundle(model, MODEL_DIR, training_stats)
+    _model_holder.publish(model)
+    return version
+
+def load_model():
+    """Load trained model (opened lazily and reloaded when it changes on disk)"""
+    with span("model.load"):
+        return _model_holder.get()
+
 def predict_face(image: np.ndarray, confidence_threshold: float = 0.6) -> Tuple[Optional[int], float]:
     """Predict student ID from face image"""
+    with span("predict_face"):
+        model = load_model()
+        if model is None:
+            return None, 0.0
+        
+        embedding = extract_face_embedding(image)
+        if embedding is None:
+            return None, 0.0
+        
+        if PREDICT_BATCH_SIZE <= 1:
+            return _classify(model, np.asarray([embedding]), confidence_threshold)[0]
+        return classify_embedding(embedding, confidence_threshold).result()
+
+def _classify_batch(items: List[Tuple[np.ndarray, float]]) -> List[Tuple[Optional[int], float]]:
+    """Classify queued (embedding, threshold) pairs with one predict_proba call"""
+    model = load_model()
+    if model is None:
+        return [(None, 0.0)] * len(items)
+    
+    predictions = _classify(model, np.array([embedding for embedding, _ in items]), 0.0)
+    return [(student_id, confidence) if confidence >= threshold else (None, confidence)
+            for (student_id, confidence), (_, threshold) in zip(predictions, items)]
+
+_batcher_lock = threading.Lock()
+_prediction_batcher: Optional[MicroBatcher] = None
+
+def prediction_batcher() -> MicroBatcher:
+    """Process-wide micro-batcher in front of the classifier, started on first use"""
+    global _prediction_batcher
+    with _batcher_lock:
+        if _prediction_batcher is None:
+            _prediction_batcher = MicroBatcher(_classify_batch, PREDICT_BATCH_SIZE, PREDICT_BATCH_WAIT_MS,
+                                               name="predict-batcher")
+        return _prediction_batcher
+
+def classify_embedding(embedding: np.ndarray, confidence_threshold: float = 0.6) -> Future:
+    """Queue one embedding for batched classification; resolves to (student_id, confidence)"""
+    return prediction_batcher().submit((embedding, confidence_threshold))
+
+def _classify(model, embeddings: np.ndarray,
+              confidence_threshold: float) -> List[Tuple[Optional[int], float]]:
+    """Classify a batch of embeddings with one predict_proba call"""
+    with span("model.predict_proba"):
+        probabilities = model.predict_proba(embeddings)
+    max_idx = np.argmax(probabilities, axis=1)
+    confidences = probabilities[np.arange(len(max_idx)), max_idx]
+    
+    results = []
+    for idx, confidence in zip(max_idx, confidences):
+        if confidence < confidence_threshold:
+            results.append((None, float(confidence)))
+        else:
+            results.append((int(model.classes_[idx]), float(confidence)))
+    
+    return results
+
+def predict_faces(image: np.ndarray,
+                  confidence_threshold: float = 0.6) -> List[Tuple[Optional[int], float, BBox]]:
+    """Recognise every face in a frame (classroom mode)
+    
+    All detected faces are classified together in a single batched call.
+    Returns (student_id or None, confidence, pixel bbox) for each face.
+    """
     model = load_model()
     if model is None:
-        return None, 0.0
+        return []
+    
+    faces = detect_faces(image)
+    if not faces:
+        return []
     
-    embedding = extract_face_embedding(image)
-    if embedding is None:
-        return None, 0.0
+    embeddings = np.array([embed_face(face) for face, _ in faces])
+    predictions = _classify(model, embeddings, confidence_threshold)
+    return [(student_id, confidence, bbox)
+            for (student_id, confidence), (_, bbox) in zip(predictions, faces)]
+
+def _is_incremental(model) -> bool:
+    """Whether students can be added to or removed from model without a refit"""
+    if isinstance(model, ProjectedModel):
+        model = model.model
+    return isinstance(model, (GalleryMatcher, IVFPQIndex))
+
+def recognize_tracked_faces(image: np.ndarray,
+                            tracker: FaceTracker) -> List[Tuple[int, Optional[int], float, BBox]]:
+    """Recognise faces in a video frame, reusing identities of tracked faces
+    
+    Faces are detected every frame and associated with the tracker's tracks;
+    only tracks that are new, or still below the tracker's confidence
+    threshold after its retry interval, are cropped, embedded and classified
+    (in one batch). Returns (track_id, student_id or None, confidence, bbox)
+    per face.
+    """
+    confidence_threshold = tracker.confidence_threshold
+    boxes = detect_face_boxes(image)
+    tracked = tracker.update(boxes)
     
-    probabilities = model.predict_proba([embedding])[0]
-    max_idx = np.argmax(probabilities)
-    confidence = float(probabilities[max_idx])
+    pending = [track for track, _ in tracked if tracker.needs_recognition(track)]
+    tracker.reused += len(tracked) - len(pending)
     
-    if confidence < confidence_threshold:
-        return None, confidence
+    model = load_model() if pending else None
+    if model is not None:
+        embeddings = np.array([embed_face(crop_bbox(image, track.bbox)) for track in pending])
+        for track, (student_id, confidence) in zip(pending, _classify(model, embeddings, confidence_threshold)):
+            tracker.set_identity(track, student_id, confidence)
     
-    student_id = model.classes_[max_idx]
-    return int(student_id), confidence
+    results = []
+    for track, _ in tracked:
+        student_id = track.student_id if track.confidence >= confidence_threshold else None
+        results.append((track.track_id, student_id, track.confidence, track.bbox))
+    
+    return results
+
+_gallery_lock = threading.Lock()
+
+@contextmanager
+def _gallery_update():
+    """Serialise gallery read-modify-write cycles across threads and processes
+    
+    Registrations from Streamlit and the API server may update the model at
+    the same time; without the lock the later save would drop the other's
+    student. load_model() inside the lock picks up any version published
+    meanwhile.
+    """
+    with _gallery_lock, open(f"{MODEL_DIR}.lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def add_student_to_gallery(student_id: int, embeddings: List[np.ndarray]) -> bool:
+    """Insert a student into a gallery or ANN model without retraining
+    
+    Returns False if the current model is a RandomForest, in which case a
+    full train_model run is still required.
+    """
+    if len(embeddings) == 0:
+        return False
+    
+    with _gallery_update():
+        model = load_model()
+        if not _is_incremental(model):
+            return False
+        
+        model.add_student(student_id, np.asarray(embeddings))
+        save_model(model)
+    return True
+
+def remove_student_from_gallery(student_id: int) -> bool:
+    """Remove a student from a gallery or ANN model without retraining"""
+    with _gallery_update():
+        model = load_model()
+        if not _is_incremental(model) or not model.remove_student(student_id):
+            return False
+        
+        save_model(model)
+    return True
 
 def is_model_trained() -> bool:
     """Check if model is trained"""
-    return os.path.exists(MODEL_PATH)
+    return bundle_exists(MODEL_DIR) or os.path.exists(MODEL_PATH)
 
 def delete_student_images(student_id: int):
     """Delete all images for a student"""
@@ -170,3 +900,11 @@ def delete_student_images(student_id: int):
     if os.path.exists(student_folder):
         import shutil
         shutil.rmtree(student_folder, ignore_errors=True)
+    
+    remove_student_from_gallery(student_id)
+    _shard_store.remove_label(student_id)
+    
+    if os.path.exists(EMBEDDING_CACHE_PATH):
+        cache = EmbeddingCache.load(EMBEDDING_CACHE_PATH)
+        if cache.drop_label(student_id):
+            cache.save()
@@ -0,0 +1,191 @@
+import os
+import fcntl
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+SHARD_DIR = os.environ.get("FACE_SHARD_DIR", "face_shards")
+SHARD_CAPACITY = 4096
+SHARD_FORMAT_VERSION = 1
+INDEX_FILE = "index.npz"
+LOCK_FILE = ".lock"
+
+class FaceShardStore:
+    """Packed store of pre-cropped grey faces, read by train_model without decoding or detection
+    
+    Faces are appended as raw uint8 rows of face_size pixels to shard files
+    (shard_00000.u8, ...) of at most `capacity` faces each, so a whole shard
+    can be memory-mapped as one (n, h, w) array. index.npz maps every face to
+    its student, source key (the dataset image path it stands for), shard and
+    row; it is replaced atomically after the face bytes are written, so a
+    crash can leave unreferenced rows but never a dangling index entry.
+    Writers take an flock so registrations from several processes can append
+    concurrently. Removed faces stay in their shard until compact().
+    """
+    
+    def __init__(self, directory: str = SHARD_DIR, face_size: Tuple[int, int] = (64, 64),
+                 capacity: int = SHARD_CAPACITY):
+        self.directory = directory
+        self.face_size = tuple(face_size)
+        self.face_bytes = int(np.prod(face_size))
+        self.capacity = capacity
+    
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILE)
+    
+    def shard_path(self, shard: int) -> str:
+        return os.path.join(self.directory, f"shard_{shard:05d}.u8")
+    
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    def _read_index(self) -> Dict[str, np.ndarray]:
+        empty = {'labels': np.zeros(0, dtype=np.int64), 'keys': np.zeros(0, dtype=str),
+                 'shards': np.zeros(0, dtype=np.int32), 'rows': np.zeros(0, dtype=np.int32)}
+        if not os.path.exists(self.index_path):
+            return empty
+        
+        with np.load(self.index_path, allow_pickle=False) as data:
+            if int(data['version']) != SHARD_FORMAT_VERSION or tuple(data['face_size']) != self.face_size:
+                raise ValueError(f"Incompatible face shard index in {self.directory}")
+            return {name: data[name] for name in empty}
+    
+    def _write_index(self, index: Dict[str, np.ndarray]):
+        tmp_path = f"{self.index_path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=np.array(SHARD_FORMAT_VERSION), face_size=np.array(self.face_size), **index)
+        os.replace(tmp_path, self.index_path)
+    
+    def __len__(self) -> int:
+        return len(self._read_index()['labels'])
+    
+    def keys(self) -> set:
+        """Source keys (dataset image paths) of every stored face"""
+        return set(self._read_index()['keys'].tolist())
+    
+    def append(self, label: int, faces: np.ndarray, keys: Sequence[str]) -> int:
+        """Store faces (n, h, w uint8) for one student; an existing key is replaced"""
+        faces = np.ascontiguousarray(faces, dtype=np.uint8).reshape(-1, *self.face_size)
+        if len(faces) != len(keys):
+            raise ValueError("Need one key per face")
+        if not len(faces):
+            return 0
+        
+        with self._locked():
+            index = self._read_index()
+            keep = ~np.isin(index['keys'], list(keys))
+            index = {name: array[keep] for name, array in index.items()}
+            
+            shard = int(index['shards'].max()) if len(index['shards']) else 0
+            shards = []
+            rows = []
+            position = 0
+            while position < len(faces):
+                path = self.shard_path(shard)
+                with open(path, 'ab') as f:
+                    size = f.tell()
+                    if size % self.face_bytes:
+                        size -= size % self.face_bytes
+                        f.truncate(size)
+                    row = size // self.face_bytes
+                    take = min(self.capacity - row, len(faces) - position)
+                    if take <= 0:
+                        shard += 1
+                        continue
+                    
+                    f.write(faces[position:position + take].tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                shards.extend([shard] * take)
+                rows.extend(range(row, row + take))
+                position += take
+            
+            index['labels'] = np.concatenate([index['labels'], np.full(len(faces), int(label), dtype=np.int64)])
+            index['keys'] = np.concatenate([index['keys'], np.array(list(keys), dtype=str)])
+            index['shards'] = np.concatenate([index['shards'], np.array(shards, dtype=np.int32)])
+            index['rows'] = np.concatenate([index['rows'], np.array(rows, dtype=np.int32)])
+            self._write_index(index)
+        return len(faces)
+    
+    def remove_label(self, label: int) -> int:
+        """Drop every face of one student from the index"""
+        if not os.path.exists(self.index_path):
+            return 0
+        with self._locked():
+            index = self._read_index()
+            keep = index['labels'] != int(label)
+            removed = int((~keep).sum())
+            if removed:
+                self._write_index({name: array[keep] for name, array in index.items()})
+        return removed
+    
+    def _read_rows(self, shard: int, rows: np.ndarray) -> np.ndarray:
+        path = self.shard_path(shard)
+        count = os.path.getsize(path) // self.face_bytes
+        data = np.memmap(path, dtype=np.uint8, mode='r', shape=(count, *self.face_size))
+        return np.array(data[rows])
+    
+    def load(self) -> Tuple[np.ndarray, List[str], np.ndarray]:
+        """Return (labels, keys, faces) for every stored face, reading each shard once"""
+        index = self._read_index()
+        faces = np.zeros((len(index['labels']), *self.face_size), dtype=np.uint8)
+        for shard in np.unique(index['shards']):
+            selected = np.flatnonzero(index['shards'] == shard)
+            faces[selected] = self._read_rows(int(shard), index['rows'][selected])
+        return index['labels'], index['keys'].tolist(), faces
+    
+    def compact(self) -> int:
+        """Rewrite live faces into new shards and drop the old ones; returns the bytes reclaimed
+        
+        The new shards are written under fresh numbers before the index is
+        switched to them, so an interrupted compaction leaves the store intact.
+        """
+        with self._locked():
+            index = self._read_index()
+            before = self.disk_bytes()
+            order = np.lexsort((index['rows'], index['shards']))
+            index = {name: array[order] for name, array in index.items()}
+            
+            faces = np.zeros((len(index['labels']), *self.face_size), dtype=np.uint8)
+            for shard in np.unique(index['shards']):
+                selected = np.flatnonzero(index['shards'] == shard)
+                faces[selected] = self._read_rows(int(shard), index['rows'][selected])
+            
+            old_shards = [name for name in os.listdir(self.directory) if name.startswith('shard_')]
+            base = max((int(name[6:11]) for name in old_shards), default=-1) + 1
+            positions = np.arange(len(faces))
+            index['shards'] = (base + positions // self.capacity).astype(np.int32)
+            index['rows'] = (positions % self.capacity).astype(np.int32)
+            for shard in np.unique(index['shards']):
+                with open(self.shard_path(int(shard)), 'wb') as f:
+                    f.write(faces[index['shards'] == shard].tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._write_index(index)
+            
+            for name in old_shards:
+                os.remove(os.path.join(self.directory, name))
+            return before - self.disk_bytes()
+    
+    def disk_bytes(self) -> int:
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory))
+    
+    def stats(self) -> dict:
+        """Number of faces, students and shards, and bytes on disk"""
+        index = self._read_index()
+        return {
+            'faces': int(len(index['labels'])),
+            'students': int(len(np.unique(index['labels']))),
+            'shards': int(len(np.unique(index['shards']))),
+            'bytes': self.disk_bytes(),
+        }
@@ -0,0 +1,142 @@
+import numpy as np
+from typing import List, Optional, Tuple
+
+BBox = Tuple[int, int, int, int]
+
+def iou_matrix(a: List[BBox], b: List[BBox]) -> np.ndarray:
+    """Intersection-over-union of every box in a against every box in b"""
+    if not a or not b:
+        return np.zeros((len(a), len(b)))
+    
+    A = np.asarray(a, dtype=np.float64)[:, None, :]
+    B = np.asarray(b, dtype=np.float64)[None, :, :]
+    iw = np.clip(np.minimum(A[..., 2], B[..., 2]) - np.maximum(A[..., 0], B[..., 0]), 0, None)
+    ih = np.clip(np.minimum(A[..., 3], B[..., 3]) - np.maximum(A[..., 1], B[..., 1]), 0, None)
+    inter = iw * ih
+    area_a = (A[..., 2] - A[..., 0]) * (A[..., 3] - A[..., 1])
+    area_b = (B[..., 2] - B[..., 0]) * (B[..., 3] - B[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-9)
+
+class Track:
+    """One face followed across frames, with the identity recognised for it"""
+    
+    def __init__(self, track_id: int, bbox: BBox, frame_index: int):
+        self.track_id = track_id
+        self.bbox = bbox
+        self.hits = 1
+        self.misses = 0
+        self.student_id: Optional[int] = None
+        self.confidence = 0.0
+        self.recognized_at: Optional[int] = None
+        self.created_at = frame_index
+    
+    @property
+    def center(self) -> Tuple[float, float]:
+        x1, y1, x2, y2 = self.bbox
+        return (x1 + x2) / 2, (y1 + y2) / 2
+    
+    @property
+    def size(self) -> float:
+        x1, y1, x2, y2 = self.bbox
+        return max(x2 - x1, y2 - y1)
+
+class FaceTracker:
+    """Associates MediaPipe face boxes over time so recognition runs once per face
+    
+    Boxes are matched to existing tracks greedily by IoU, falling back to
+    centroid distance (relative to face size) for fast movement. A track is
+    sent for recognition when it first appears, and again only while its
+    confidence is below confidence_threshold, at most once every
+    retry_interval frames. Tracks unseen for max_misses frames are dropped.
+    """
+    
+    def __init__(self, iou_threshold: float = 0.3, max_center_shift: float = 0.5,
+                 max_misses: int = 10, confidence_threshold: float = 0.6,
+                 retry_interval: int = 5):
+        self.iou_threshold = iou_threshold
+        self.max_center_shift = max_center_shift
+        self.max_misses = max_misses
+        self.confidence_threshold = confidence_threshold
+        self.retry_interval = retry_interval
+        self.tracks: List[Track] = []
+        self.frame_index = 0
+        self._next_id = 1
+        self.recognitions = 0
+        self.reused = 0
+    
+    def update(self, boxes: List[BBox]) -> List[Tuple[Track, int]]:
+        """Associate this frame's boxes with tracks; returns (track, box index) pairs"""
+        self.frame_index += 1
+        ious = iou_matrix([t.bbox for t in self.tracks], boxes)
+        matched_tracks = set()
+        matched_boxes = set()
+        pairs = []
+        
+        for flat in np.argsort(-ious, axis=None):
+            t, b = np.unravel_index(flat, ious.shape)
+            if ious[t, b] < self.iou_threshold:
+                break
+            if t in matched_tracks or b in matched_boxes:
+                continue
+            matched_tracks.add(t)
+            matched_boxes.add(b)
+            pairs.append((t, b))
+        
+        for t, track in enumerate(self.tracks):
+            if t in matched_tracks:
+                continue
+            best = None
+            best_shift = self.max_center_shift
+            for b, box in enumerate(boxes):
+                if b in matched_boxes:
+                    continue
+                cx, cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+                shift = np.hypot(cx - track.center[0], cy - track.center[1]) / max(track.size, 1)
+                if shift < best_shift:
+                    best, best_shift = b, shift
+            if best is not None:
+                matched_tracks.add(t)
+                matched_boxes.add(best)
+                pairs.append((t, best))
+        
+        result = []
+        for t, b in pairs:
+            track = self.tracks[t]
+            track.bbox = boxes[b]
+            track.hits += 1
+            track.misses = 0
+            result.append((track, b))
+        
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        
+        for b, box in enumerate(boxes):
+            if b not in matched_boxes:
+                track = Track(self._next_id, box, self.frame_index)
+                self._next_id += 1
+                self.tracks.append(track)
+                result.append((track, b))
+        
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        return result
+    
+    def needs_recognition(self, track: Track) -> bool:
+        """Whether the track's identity should be (re)computed this frame"""
+        if track.recognized_at is None:
+            return True
+        if track.student_id is not None and track.confidence >= self.confidence_threshold:
+            return False
+        return self.frame_index - track.recognized_at >= self.retry_interval
+    
+    def set_identity(self, track: Track, student_id: Optional[int], confidence: float):
+        """Record a recognition result; a miss does not erase an earlier identity"""
+        self.recognitions += 1
+        track.recognized_at = self.frame_index
+        if student_id is not None or track.student_id is None:
+            track.student_id = student_id
+            track.confidence = confidence
+    
+    def stats(self) -> dict:
+        """Counts of recognitions run and identities reused from tracks"""
+        return {'tracks': len(self.tracks), 'recognitions': self.recognitions, 'reused': self.reused}
@@ -0,0 +1,216 @@
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+def l2_normalize(X: np.ndarray) -> np.ndarray:
+    """L2-normalise rows as float32"""
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X[np.newaxis, :]
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return X / norms
+
+def top_k_proba(top_scores: np.ndarray, top_label_index: np.ndarray, n_classes: int,
+                temperature: float) -> np.ndarray:
+    """Turn per-query top-k similarities into per-student probabilities
+    
+    Each student is scored by its best similarity among the query's top-k
+    neighbours; a temperature softmax over those scores gives the result.
+    """
+    n_queries, k = top_scores.shape
+    best = np.full((n_queries, n_classes), -np.inf)
+    rows = np.repeat(np.arange(n_queries), k)
+    np.maximum.at(best, (rows, top_label_index.ravel()), top_scores.astype(np.float64).ravel())
+    
+    proba = np.exp((best - best.max(axis=1, keepdims=True)) / temperature)
+    return proba / proba.sum(axis=1, keepdims=True)
+
+def calibrate_temperature(X: np.ndarray, y: np.ndarray, target: float = 0.8,
+                          max_queries: int = 1024, seed: int = 0) -> Optional[float]:
+    """Softmax temperature at which a typical enrolled face scores `target` confidence
+    
+    Raw pixel embeddings all point roughly the same way, so cosine
+    similarities sit close to 1 and a fixed temperature leaves even exact
+    matches below the confidence threshold. The scale is taken from the
+    gallery itself: a sample of rows is scored leave-one-out against the
+    rest, and the temperature is chosen so the median confidence of the rows
+    matched to their own student is `target`. Returns None when no row is.
+    """
+    X = l2_normalize(X)
+    classes, label_index = np.unique(np.asarray(y), return_inverse=True)
+    order = np.argsort(label_index, kind='stable')
+    starts = np.searchsorted(label_index[order], np.arange(len(classes)))
+    picks = np.arange(len(X))
+    if len(picks) > max_queries:
+        picks = np.random.default_rng(seed).choice(len(X), size=max_queries, replace=False)
+    
+    gaps = []
+    for offset in range(0, len(picks), 256):
+        block = picks[offset:offset + 256]
+        sims = X[block] @ X.T
+        sims[np.arange(len(block)), block] = -np.inf
+        best = np.maximum.reduceat(sims[:, order], starts, axis=1)
+        own = best[np.arange(len(block)), label_index[block]]
+        matched = np.isfinite(own) & (best.argmax(axis=1) == label_index[block])
+        gaps.append(best[matched] - own[matched, None])
+    gaps = np.concatenate(gaps)
+    if len(gaps) == 0:
+        return None
+    
+    low, high = -12.0, 2.0  # log10 of the temperature; confidence falls as it rises
+    for _ in range(50):
+        mid = (low + high) / 2
+        confidence = 1.0 / np.exp(gaps / 10 ** mid).sum(axis=1)
+        low, high = (mid, high) if np.median(confidence) > target else (low, mid)
+    return float(10 ** low)
+
+class GalleryMatcher:
+    """Nearest-neighbour recognition engine over all enrolled face embeddings
+    
+    Keeps an L2-normalised float32 matrix of gallery embeddings with one label
+    per row. A query is scored against every row with a single matrix product;
+    the top_k most similar rows are aggregated per student (best similarity)
+    and turned into probabilities with a temperature softmax, so a student
+    with few enrolled images is not outvoted by one with many. from_embeddings
+    calibrates the temperature on the training gallery. predict_proba
+    and classes_ follow the scikit-learn convention, so the matcher can stand
+    in for the RandomForest in predict_face.
+    
+    Rows are stored in a buffer with spare capacity, so add_student appends in
+    place. Readers take a snapshot of (matrix, labels), so a prediction that
+    is already running is not affected by a concurrent add or remove.
+    """
+    
+    def __init__(self, dim: int, top_k: int = 5, temperature: float = 0.02, capacity: int = 256):
+        self.dim = dim
+        self.top_k = top_k
+        self.temperature = temperature
+        self._buffer = np.zeros((capacity, dim), dtype=np.float32)
+        self._labels = np.zeros(capacity, dtype=np.int64)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._publish()
+    
+    @classmethod
+    def from_embeddings(cls, X: np.ndarray, y: np.ndarray, top_k: int = 5,
+                        temperature: Optional[float] = None) -> "GalleryMatcher":
+        """Build a gallery from training embeddings and student ids, calibrating the temperature if not given"""
+        X = np.asarray(X)
+        if temperature is None:
+            temperature = calibrate_temperature(X, y) or 0.02
+        gallery = cls(X.shape[1], top_k=top_k, temperature=temperature, capacity=max(256, len(X)))
+        gallery._append(l2_normalize(X), np.asarray(y, dtype=np.int64))
+        gallery._publish()
+        return gallery
+    
+    def to_arrays(self) -> Tuple[dict, Dict[str, np.ndarray]]:
+        """Split the gallery into JSON-able params and NumPy arrays"""
+        matrix, labels = self._state[0], self._state[1]
+        params = {'dim': self.dim, 'top_k': self.top_k, 'temperature': self.temperature}
+        return params, {'matrix': matrix, 'labels': labels}
+    
+    @classmethod
+    def from_arrays(cls, params: dict, arrays: Dict[str, np.ndarray]) -> "GalleryMatcher":
+        """Rebuild a gallery around existing (possibly memory-mapped) arrays
+        
+        The arrays are used as the row buffer without copying; the first
+        add_student or remove_student copies them into a private buffer.
+        """
+        gallery = cls(params['dim'], top_k=params['top_k'], temperature=params['temperature'], capacity=0)
+        gallery._buffer = arrays['matrix']
+        gallery._labels = arrays['labels']
+        gallery._size = len(arrays['labels'])
+        gallery._publish()
+        return gallery
+    
+    def __getstate__(self):
+        matrix, labels = self._state[0], self._state[1]
+        return {'dim': self.dim, 'top_k': self.top_k, 'temperature': self.temperature,
+                'matrix': matrix, 'labels': labels}
+    
+    def __setstate__(self, state):
+        self.__init__(state['dim'], top_k=state['top_k'], temperature=state['temperature'],
+                      capacity=max(256, len(state['labels'])))
+        self._append(state['matrix'], state['labels'])
+        self._publish()
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    @property
+    def classes_(self) -> np.ndarray:
+        return self._state[2]
+    
+    def _append(self, rows: np.ndarray, labels: np.ndarray):
+        needed = self._size + len(rows)
+        if needed > len(self._buffer):
+            capacity = max(needed, 2 * len(self._buffer))
+            buffer = np.zeros((capacity, self.dim), dtype=np.float32)
+            buffer[:self._size] = self._buffer[:self._size]
+            new_labels = np.zeros(capacity, dtype=np.int64)
+            new_labels[:self._size] = self._labels[:self._size]
+            self._buffer, self._labels = buffer, new_labels
+        
+        self._buffer[self._size:needed] = rows
+        self._labels[self._size:needed] = labels
+        self._size = needed
+    
+    def _publish(self):
+        matrix = self._buffer[:self._size]
+        labels = self._labels[:self._size]
+        classes, label_index = np.unique(labels, return_inverse=True)
+        self._state = (matrix, labels, classes, label_index)
+    
+    def add_student(self, student_id: int, embeddings: np.ndarray):
+        """Add (or extend) one student's embeddings without refitting"""
+        rows = l2_normalize(embeddings)
+        with self._lock:
+            self._append(rows, np.full(len(rows), int(student_id), dtype=np.int64))
+            self._publish()
+    
+    def remove_student(self, student_id: int) -> int:
+        """Remove all rows of one student; returns the number removed"""
+        with self._lock:
+            labels = self._labels[:self._size]
+            keep = labels != int(student_id)
+            removed = int(self._size - keep.sum())
+            if removed:
+                kept = int(keep.sum())
+                buffer = np.zeros(self._buffer.shape, dtype=np.float32)
+                buffer[:kept] = self._buffer[:self._size][keep]
+                new_labels = np.zeros(self._labels.shape, dtype=np.int64)
+                new_labels[:kept] = labels[keep]
+                self._buffer, self._labels, self._size = buffer, new_labels, kept
+                self._publish()
+        return removed
+    
+    def similarities(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Cosine similarity of each query to every gallery row, plus row labels"""
+        matrix, labels = self._state[0], self._state[1]
+        return l2_normalize(X) @ matrix.T, labels
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Softmax over each student's best top-k similarity, in classes_ order"""
+        matrix, _, classes, label_index = self._state
+        queries = l2_normalize(X)
+        if len(matrix) == 0:
+            return np.zeros((len(queries), len(classes)), dtype=np.float64)
+        
+        scores = queries @ matrix.T
+        k = min(self.top_k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        return top_k_proba(top_scores, label_index[top], len(classes), self.temperature)
+    
+    def match(self, embedding: np.ndarray, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Rank students by their best similarity to the query"""
+        matrix, _, classes, label_index = self._state
+        if len(matrix) == 0:
+            return []
+        
+        scores = l2_normalize(embedding)[0] @ matrix.T
+        best = np.full(len(classes), -np.inf, dtype=np.float32)
+        np.maximum.at(best, label_index, scores)
+        order = np.argsort(-best)[:top_k]
+        return [(int(classes[i]), float(best[i])) for i in order]
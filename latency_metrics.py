@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import atexit
+import threading
+import numpy as np
+from contextlib import nullcontext
+from typing import Dict, Optional
+
+METRICS_ENABLED = os.environ.get("FACE_METRICS", "0").lower() not in ("", "0", "false", "no")
+METRICS_WINDOW = int(os.environ.get("FACE_METRICS_WINDOW", 2048))
+METRICS_DUMP_PATH = os.environ.get("FACE_METRICS_DUMP")
+
+_NULL_SPAN = nullcontext()
+
+class StageHistogram:
+    """Rolling window of the most recent latencies of one stage"""
+    
+    def __init__(self, window: int):
+        self.samples = np.zeros(window, dtype=np.float64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def record(self, seconds: float):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+    
+    def summary(self) -> dict:
+        window = self.samples[:min(self.count, len(self.samples))]
+        p50, p95, p99 = np.percentile(window, [50, 95, 99]) * 1000 if len(window) else (0.0, 0.0, 0.0)
+        return {
+            'count': self.count,
+            'mean_ms': round(1000 * self.total / max(self.count, 1), 3),
+            'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3),
+            'max_ms': round(1000 * self.max, 3),
+        }
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'start')
+    
+    def __init__(self, recorder: "LatencyRecorder", name: str):
+        self.recorder = recorder
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.recorder.record(self.name, time.perf_counter() - self.start)
+
+class LatencyRecorder:
+    """Per-stage timing spans and counters for the recognition hot path
+    
+    span(name) times a block into a rolling histogram of the last `window`
+    samples per stage, from which snapshot() reports p50/p95/p99. count()
+    bumps named counters such as faces found or missed. While disabled,
+    span() returns a shared no-op context manager and count() returns at
+    once, so instrumented code pays about one function call per stage.
+    """
+    
+    def __init__(self, enabled: bool = METRICS_ENABLED, window: int = METRICS_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages: Dict[str, StageHistogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._started_at = time.time()
+    
+    def span(self, name: str):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+    
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = StageHistogram(self.window)
+            histogram.record(seconds)
+    
+    def count(self, name: str, n: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+    
+    def snapshot(self) -> dict:
+        """Latency percentiles per stage and counter values"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'since': self._started_at,
+                'window': self.window,
+                'stages': {name: h.summary() for name, h in sorted(self._stages.items())},
+                'counters': dict(sorted(self._counters.items())),
+            }
+    
+    def drain(self) -> dict:
+        """Raw samples and counter increments recorded since the last drain, clearing them"""
+        with self._lock:
+            data = {'stages': {name: h.samples[:min(h.count, len(h.samples))].tolist()
+                               for name, h in self._stages.items()},
+                    'counters': dict(self._counters)}
+            self._stages.clear()
+            self._counters.clear()
+        return data
+    
+    def merge(self, data: dict):
+        """Add samples drained from another recorder, e.g. in a worker process"""
+        if not self.enabled:
+            return
+        for name, samples in data['stages'].items():
+            for seconds in samples:
+                self.record(name, seconds)
+        with self._lock:
+            for name, n in data['counters'].items():
+                self._counters[name] = self._counters.get(name, 0) + n
+    
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._started_at = time.time()
+    
+    def dump(self, path: str) -> str:
+        """Write snapshot() as JSON"""
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        return path
+
+_recorder = LatencyRecorder()
+
+def span(name: str):
+    """Context manager timing one stage (a no-op while metrics are disabled)"""
+    return _recorder.span(name)
+
+def count(name: str, n: int = 1):
+    """Increment a named counter"""
+    _recorder.count(name, n)
+
+def set_enabled(enabled: bool):
+    """Turn instrumentation on or off at runtime"""
+    _recorder.enabled = enabled
+
+def is_enabled() -> bool:
+    return _recorder.enabled
+
+def snapshot() -> dict:
+    """Current per-stage latency percentiles and counters"""
+    return _recorder.snapshot()
+
+def drain() -> dict:
+    """Samples recorded since the last drain, for sending back from a worker process"""
+    return _recorder.drain()
+
+def merge(data: dict):
+    """Fold samples drained in a worker process into this process's metrics"""
+    _recorder.merge(data)
+
+def reset():
+    _recorder.reset()
+
+def dump(path: Optional[str] = None) -> str:
+    """Write the current metrics to path (default FACE_METRICS_DUMP or latency_metrics.json)"""
+    return _recorder.dump(path or METRICS_DUMP_PATH or "latency_metrics.json")
+
+def _dump_at_exit():
+    if _recorder.enabled:
+        dump(METRICS_DUMP_PATH)
+
+if METRICS_DUMP_PATH:
+    atexit.register(_dump_at_exit)
@@ -0,0 +1,122 @@
+import time
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+class MicroBatcher:
+    """Groups concurrent requests into batches for one vectorised call
+    
+    submit() enqueues an item and returns a Future. A single worker thread
+    takes the first waiting item, then keeps collecting until max_batch_size
+    items are gathered or max_wait_ms has passed since that first item, and
+    passes the whole batch to batch_fn, which must return one result per item.
+    Each result (or the exception batch_fn raised) is routed back to its
+    caller's future. stats() reports batch fill, queue depth and queueing
+    delay; close() lets the worker finish every queued item first.
+    """
+    
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0, name: str = "micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.batch_sizes = Counter()
+        self.max_queue_depth = 0
+        self._queue_delay_total = 0.0
+        self.max_queue_delay = 0.0
+        self._run_time_total = 0.0
+        
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def submit(self, item) -> Future:
+        """Queue an item; the future resolves to batch_fn's result for it"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.put((item, future, time.perf_counter()))
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return future
+    
+    def __call__(self, item):
+        """Submit an item and wait for its result"""
+        return self.submit(item).result()
+    
+    def close(self, timeout: Optional[float] = 5.0):
+        """Stop accepting items, finish what is queued and stop the worker (timeout=None waits for all)"""
+        with self._lock:
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout)
+    
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                entry = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if entry is None:
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+    
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            
+            batch = self._collect(first)
+            started = time.perf_counter()
+            futures = [future for _, future, _ in batch]
+            try:
+                results = self.batch_fn([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"batch_fn returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                self.errors += 1
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            
+            delays = [started - submitted for _, _, submitted in batch]
+            self.batches += 1
+            self.items += len(batch)
+            self.batch_sizes[len(batch)] += 1
+            self._queue_delay_total += sum(delays)
+            self.max_queue_delay = max(self.max_queue_delay, max(delays))
+            self._run_time_total += time.perf_counter() - started
+    
+    def stats(self) -> dict:
+        """Batch fill, queue depth and queueing delay since the batcher was created"""
+        batches = max(self.batches, 1)
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'errors': self.errors,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'avg_batch_size': self.items / batches,
+            'fill_ratio': self.items / (batches * self.max_batch_size),
+            'batch_sizes': dict(sorted(self.batch_sizes.items())),
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'avg_queue_ms': 1000 * self._queue_delay_total / max(self.items, 1),
+            'max_queue_ms': 1000 * self.max_queue_delay,
+            'avg_batch_run_ms': 1000 * self._run_time_total / batches,
+        }
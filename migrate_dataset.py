@@ -0,0 +1,82 @@
+import os
+import argparse
+import numpy as np
+
+from embedding_cache import EmbeddingCache, EMBEDDING_CACHE_PATH
+from face_shards import FaceShardStore
+from face_recognition_model import DATASET_DIR, TRAIN_WORKERS, collect_face_crops, list_dataset_images, sidecar_path
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+def migrate(store: FaceShardStore, keep_originals: bool = False, workers: int = TRAIN_WORKERS) -> dict:
+    """Move every dataset/ image into the shard store as a pre-cropped face
+    
+    Crops come from the embedding cache where possible and are detected
+    otherwise. Migrated frames are deleted unless keep_originals is set;
+    images without a detectable face are left in place and reported.
+    """
+    students = list_dataset_images()
+    dataset_bytes = directory_bytes(DATASET_DIR)
+    cache = EmbeddingCache.load(EMBEDDING_CACHE_PATH)
+    
+    def report(progress, message):
+        print(f"\r{message}", end="", flush=True)
+    
+    faces = collect_face_crops(students, cache, workers, report)
+    print()
+    
+    migrated = []
+    no_face = []
+    for student_id, paths in students:
+        found = [path for path in paths if faces.get(path) is not None]
+        no_face.extend(path for path in paths if faces.get(path) is None)
+        if found:
+            store.append(student_id, np.stack([faces[path] for path in found]), found)
+            migrated.extend(found)
+    
+    if not keep_originals:
+        for path in migrated:
+            os.remove(path)
+            if os.path.exists(sidecar_path(path)):
+                os.remove(sidecar_path(path))
+        for student_id, _ in students:
+            folder = os.path.join(DATASET_DIR, str(student_id))
+            if os.path.isdir(folder) and not os.listdir(folder):
+                os.rmdir(folder)
+        cache.prune(no_face)
+    if cache.dirty:
+        cache.save()
+    
+    return {
+        'students': len(students),
+        'migrated': len(migrated),
+        'no_face': no_face,
+        'dataset_bytes_before': dataset_bytes,
+        'dataset_bytes_after': directory_bytes(DATASET_DIR),
+        'shard_bytes': store.disk_bytes(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert dataset/ images into packed face shards")
+    parser.add_argument("--keep-originals", action="store_true", help="keep the full-frame JPEGs after migrating")
+    parser.add_argument("--workers", type=int, default=TRAIN_WORKERS)
+    parser.add_argument("--compact", action="store_true", help="only compact the shards of deleted students")
+    args = parser.parse_args()
+    
+    store = FaceShardStore()
+    if args.compact:
+        print(f"Reclaimed {store.compact()} bytes; {store.stats()}")
+        return
+    
+    result = migrate(store, args.keep_originals, args.workers)
+    print(f"Migrated {result['migrated']} images of {result['students']} students into {store.directory}/")
+    print(f"dataset/: {result['dataset_bytes_before']:,} -> {result['dataset_bytes_after']:,} bytes; "
+          f"shards: {result['shard_bytes']:,} bytes")
+    for path in result['no_face']:
+        print(f"  no face detected, left in place: {path}")
+    print("Set DATASET_STORAGE=shards so new registrations are stored in the shards too.")
+
+if __name__ == "__main__":
+    main()
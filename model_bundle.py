@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from gallery import GalleryMatcher
+from ann_index import IVFPQIndex
+from projection import ProjectedModel
+
+MODEL_DIR = "face_model"
+BUNDLE_FORMAT_VERSION = 1
+CURRENT_FILE = "CURRENT"
+KEEP_VERSIONS = 2
+FEATURE_EXTRACTOR = {'type': 'grey_pixels', 'size': [64, 64], 'scale': 1 / 255}
+
+class ForestModel:
+    """Array-backed RandomForest that predicts without scikit-learn objects
+    
+    Every tree's nodes are concatenated into flat arrays (children, feature,
+    threshold, normalised leaf distribution), so the forest can be saved as
+    .npy files and memory-mapped. predict_proba walks all trees for all
+    queries at once, one tree level per step, and averages the leaf
+    distributions exactly like RandomForestClassifier.predict_proba.
+    """
+    
+    def __init__(self, classes: np.ndarray, roots: np.ndarray, children_left: np.ndarray,
+                 children_right: np.ndarray, feature: np.ndarray, threshold: np.ndarray,
+                 leaf_proba: np.ndarray, max_depth: int):
+        self.classes_ = classes
+        self.roots = roots
+        self.children_left = children_left
+        self.children_right = children_right
+        self.feature = feature
+        self.threshold = threshold
+        self.leaf_proba = leaf_proba
+        self.max_depth = max_depth
+    
+    @classmethod
+    def from_sklearn(cls, forest) -> "ForestModel":
+        """Flatten a fitted RandomForestClassifier"""
+        roots = []
+        left = []
+        right = []
+        feature = []
+        threshold = []
+        proba = []
+        offset = 0
+        
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            roots.append(offset)
+            left.append(np.where(tree.children_left >= 0, tree.children_left + offset, -1))
+            right.append(np.where(tree.children_right >= 0, tree.children_right + offset, -1))
+            feature.append(np.maximum(tree.feature, 0))
+            threshold.append(tree.threshold)
+            
+            value = tree.value[:, 0, :].astype(np.float64)
+            totals = value.sum(axis=1, keepdims=True)
+            totals[totals == 0] = 1.0
+            proba.append(value / totals)
+            offset += tree.node_count
+        
+        return cls(
+            classes=np.asarray(forest.classes_),
+            roots=np.array(roots, dtype=np.int64),
+            children_left=np.concatenate(left).astype(np.int64),
+            children_right=np.concatenate(right).astype(np.int64),
+            feature=np.concatenate(feature).astype(np.int64),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            leaf_proba=np.concatenate(proba).astype(np.float32),
+            max_depth=max(e.tree_.max_depth for e in forest.estimators_)
+        )
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        
+        nodes = np.repeat(self.roots[np.newaxis, :], len(X), axis=0)
+        rows = np.arange(len(X))[:, np.newaxis]
+        for _ in range(self.max_depth):
+            left = self.children_left[nodes]
+            internal = left >= 0
+            if not internal.any():
+                break
+            
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(internal, np.where(go_left, left, self.children_right[nodes]), nodes)
+        
+        return self.leaf_proba[nodes].mean(axis=1, dtype=np.float64)
+    
+    def to_arrays(self) -> Tuple[dict, Dict[str, np.ndarray]]:
+        arrays = {'classes': self.classes_, 'roots': self.roots,
+                  'children_left': self.children_left, 'children_right': self.children_right,
+                  'feature': self.feature, 'threshold': self.threshold,
+                  'leaf_proba': self.leaf_proba}
+        return {'max_depth': int(self.max_depth)}, arrays
+    
+    @classmethod
+    def from_arrays(cls, params: dict, arrays: Dict[str, np.ndarray]) -> "ForestModel":
+        return cls(arrays['classes'], arrays['roots'], arrays['children_left'],
+                   arrays['children_right'], arrays['feature'], arrays['threshold'],
+                   arrays['leaf_proba'], params['max_depth'])
+
+ENGINE_TYPES = {
+    'random_forest': ForestModel,
+    'gallery': GalleryMatcher,
+    'ann': IVFPQIndex,
+}
+
+def _engine_name(model) -> str:
+    for name, engine_type in ENGINE_TYPES.items():
+        if isinstance(model, engine_type):
+            return name
+    raise TypeError(f"Cannot bundle model of type {type(model).__name__}")
+
+def _current_version(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def bundle_exists(directory: str = MODEL_DIR) -> bool:
+    """Whether a published bundle is available"""
+    return _current_version(directory) is not None
+
+def bundle_signature(directory: str = MODEL_DIR) -> Optional[Tuple[int, int, int]]:
+    """Cheap change detector: (inode, mtime_ns, size) of the CURRENT pointer"""
+    try:
+        st = os.stat(os.path.join(directory, CURRENT_FILE))
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def save_bundle(model, directory: str = MODEL_DIR, training_stats: Optional[dict] = None) -> str:
+    """Write a model as a new bundle version and publish it atomically
+    
+    The version is written to its own subdirectory (manifest.json plus one
+    .npy per array) and then made current by replacing the CURRENT pointer
+    file with os.replace. Readers either see the old version or the new one,
+    never a partial write. Older versions beyond KEEP_VERSIONS are removed.
+    Returns the version id.
+    """
+    projection = None
+    if isinstance(model, ProjectedModel):
+        projection = {'weights': model.weights, 'bias': model.bias}
+        model = model.model
+    
+    if not isinstance(model, tuple(ENGINE_TYPES.values())):
+        model = ForestModel.from_sklearn(model)
+    
+    engine = _engine_name(model)
+    params, arrays = model.to_arrays()
+    if projection is not None:
+        arrays.update({f"projection_{name}": array for name, array in projection.items()})
+    
+    os.makedirs(directory, exist_ok=True)
+    now = time.time_ns()
+    version = f"v{time.strftime('%Y%m%dT%H%M%S', time.localtime(now / 1e9))}.{now % 10**9:09d}-{uuid.uuid4().hex[:4]}"
+    tmp_dir = os.path.join(directory, f".{version}.tmp")
+    os.makedirs(tmp_dir)
+    
+    array_info = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        array_info[name] = {'dtype': str(array.dtype), 'shape': list(array.shape)}
+    
+    manifest = {
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'version': version,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'engine': engine,
+        'params': params,
+        'projection': projection is not None,
+        'feature_extractor': FEATURE_EXTRACTOR,
+        'classes': [int(c) for c in model.classes_],
+        'training_stats': training_stats or {},
+        'arrays': array_info,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    
+    os.rename(tmp_dir, os.path.join(directory, version))
+    
+    pointer_tmp = os.path.join(directory, f".{CURRENT_FILE}.{version}.tmp")
+    with open(pointer_tmp, 'w') as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(directory, CURRENT_FILE))
+    
+    _remove_old_versions(directory, keep=version)
+    return version
+
+def _remove_old_versions(directory: str, keep: str):
+    versions = sorted(d for d in os.listdir(directory)
+                      if d.startswith('v') and os.path.isdir(os.path.join(directory, d)))
+    stale = [v for v in versions if v != keep][:-(KEEP_VERSIONS - 1) or None]
+    for version in stale:
+        shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+def read_manifest(directory: str = MODEL_DIR) -> Optional[dict]:
+    """Read the manifest of the current bundle version"""
+    version = _current_version(directory)
+    if version is None:
+        return None
+    
+    with open(os.path.join(directory, version, "manifest.json")) as f:
+        return json.load(f)
+
+def load_bundle(directory: str = MODEL_DIR, mmap_mode: Optional[str] = 'r'):
+    """Open the current bundle version, memory-mapping its arrays by default
+    
+    Only the small manifest is parsed eagerly; array pages are read on first
+    use, and processes on the same host share one page-cached copy.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    if manifest['format_version'] != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model bundle version: {manifest['format_version']}")
+    
+    version_dir = os.path.join(directory, manifest['version'])
+    arrays = {name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+              for name in manifest['arrays']}
+    
+    model = ENGINE_TYPES[manifest['engine']].from_arrays(manifest['params'], arrays)
+    if manifest['projection']:
+        model = ProjectedModel(arrays['projection_weights'], arrays['projection_bias'], model)
+    
+    return model
@@ -0,0 +1,90 @@
+import numpy as np
+from typing import Optional, Tuple
+from sklearn.decomposition import PCA
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+from sklearn.pipeline import Pipeline
+
+PROJECTIONS = ("none", "pca", "pca_lda")
+PCA_COMPONENTS = 256
+LDA_COMPONENTS = 128
+
+def fit_projection(X: np.ndarray, y: np.ndarray, method: str = "pca_lda") -> Optional[Pipeline]:
+    """Fit a dimensionality-reducing projection on training embeddings
+    
+    "pca" whitens onto up to PCA_COMPONENTS principal components; "pca_lda"
+    follows that with LDA down to at most LDA_COMPONENTS (and fewer than the
+    number of students). LDA is skipped when there are fewer than three
+    students, since it would leave at most one dimension.
+    """
+    if method not in PROJECTIONS:
+        raise ValueError(f"Unknown projection: {method}")
+    if method == "none":
+        return None
+    
+    n_classes = len(np.unique(y))
+    n_components = max(1, min(PCA_COMPONENTS, len(X) - 1, X.shape[1]))
+    steps = [('pca', PCA(n_components=n_components, whiten=True, svd_solver='randomized', random_state=42))]
+    
+    if method == "pca_lda" and n_classes >= 3:
+        lda_components = min(LDA_COMPONENTS, n_classes - 1, n_components)
+        steps.append(('lda', LinearDiscriminantAnalysis(n_components=lda_components)))
+    
+    projection = Pipeline(steps)
+    projection.fit(X, y)
+    return projection
+
+def affine_from_pipeline(projection: Pipeline) -> Tuple[np.ndarray, np.ndarray]:
+    """Fold a fitted PCA(+LDA) pipeline into one affine map X @ weights + bias"""
+    pca = projection.named_steps['pca']
+    weights = pca.components_.T.astype(np.float64)
+    if pca.whiten:
+        weights = weights / np.sqrt(pca.explained_variance_)
+    bias = -pca.mean_ @ weights
+    
+    if 'lda' in projection.named_steps:
+        lda = projection.named_steps['lda']
+        scalings = lda.scalings_[:, :lda.n_components]
+        bias = (bias - lda.xbar_) @ scalings
+        weights = weights @ scalings
+    
+    return weights.astype(np.float32), bias.astype(np.float32)
+
+class ProjectedModel:
+    """A recognition engine that sees embeddings through a fitted projection
+    
+    The projection is stored as a single affine map, so the same object works
+    whether it was just trained or opened from a memory-mapped model bundle.
+    It is persisted together with the engine and applied in predict_proba and
+    in incremental add_student/remove_student calls for engines that support
+    them.
+    """
+    
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, model):
+        self.weights = weights
+        self.bias = bias
+        self.model = model
+    
+    @classmethod
+    def from_pipeline(cls, projection: Pipeline, model) -> "ProjectedModel":
+        weights, bias = affine_from_pipeline(projection)
+        return cls(weights, bias, model)
+    
+    @property
+    def classes_(self) -> np.ndarray:
+        return self.model.classes_
+    
+    @property
+    def output_dim(self) -> int:
+        return self.weights.shape[1]
+    
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return np.asarray(X, dtype=np.float32) @ self.weights + self.bias
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        return self.model.predict_proba(self.transform(X))
+    
+    def add_student(self, student_id: int, embeddings: np.ndarray):
+        self.model.add_student(student_id, self.transform(embeddings))
+    
+    def remove_student(self, student_id: int) -> int:
+        return self.model.remove_student(student_id)
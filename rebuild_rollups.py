@@ -0,0 +1,17 @@
+import argparse
+
+import database
+from database import init_database, rebuild_rollups
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute the attendance rollup tables from the raw records")
+    parser.add_argument("--db", default=database.DB_PATH, help="database file (default: %(default)s)")
+    args = parser.parse_args()
+    
+    database.DB_PATH = args.db
+    init_database()
+    for table, rows in rebuild_rollups().items():
+        print(f"{table}: {rows} rows")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import threading
+from typing import Optional
+
+from face_recognition_model import TrainingCancelled, train_model
+
+TRAINING_STATUS_PATH = os.environ.get("TRAINING_STATUS_PATH", "training_status.json")
+TRAINING_LOCK_PATH = os.environ.get("TRAINING_LOCK_PATH", "training.lock")
+STATUS_WRITE_INTERVAL = 0.5
+LOCK_ATTEMPTS = 5  # status() elsewhere may be probing the lock for a moment
+LOCK_RETRY_DELAY = 0.02
+
+ACTIVE_STATES = ("running",)
+
+class TrainingJobManager:
+    """Single-flight background training with persisted, pollable status
+    
+    start() runs train_model in a background thread under an exclusive
+    flock on TRAINING_LOCK_PATH, so only one job runs at a time across
+    Streamlit sessions and the API process alike. Progress is written
+    atomically to TRAINING_STATUS_PATH, where status() from any session or
+    process can read it. cancel() leaves the job id in a .cancel file next
+    to it, which the job checks between chunks of images and again before
+    fitting and publishing the model; finished embeddings are kept in the
+    cache so the next job resumes from them. Recognition keeps using the
+    previous model until the new one is published.
+    """
+    
+    def __init__(self, status_path: str = TRAINING_STATUS_PATH, lock_path: str = TRAINING_LOCK_PATH):
+        self.status_path = status_path
+        self.lock_path = lock_path
+        self.cancel_path = f"{status_path}.cancel"
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+    
+    def _read(self) -> dict:
+        try:
+            with open(self.status_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+    
+    def _write(self, status: dict):
+        status['updated_at'] = time.time()
+        tmp_path = f"{self.status_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, self.status_path)
+    
+    def _try_lock(self) -> Optional[int]:
+        """Take the single-flight lock; returns its file descriptor or None if held"""
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+    
+    def _lock_held(self) -> bool:
+        fd = self._try_lock()
+        if fd is None:
+            return True
+        os.close(fd)
+        return False
+    
+    def start(self, engine: Optional[str] = None, projection: Optional[str] = None) -> Optional[str]:
+        """Start a training job; returns its id, or None if one is already running"""
+        with self._lock:
+            fd = self._try_lock()
+            for _ in range(LOCK_ATTEMPTS - 1):
+                if fd is not None:
+                    break
+                time.sleep(LOCK_RETRY_DELAY)
+                fd = self._try_lock()
+            if fd is None:
+                return None
+            
+            job_id = uuid.uuid4().hex[:12]
+            status = {
+                'job_id': job_id,
+                'state': 'running',
+                'progress': 0,
+                'message': "Starting training...",
+                'error': None,
+                'engine': engine,
+                'projection': projection,
+                'pid': os.getpid(),
+                'started_at': time.time(),
+                'finished_at': None,
+            }
+            self._write(status)
+            self._thread = threading.Thread(target=self._run, args=(fd, status), name=f"train-{job_id}", daemon=True)
+            self._thread.start()
+            return job_id
+    
+    def _run(self, fd: int, status: dict):
+        last_write = 0.0
+        cancelled = False
+        
+        def update_progress(progress, message):
+            nonlocal last_write
+            changed = int(progress) != status['progress']
+            status['progress'] = int(progress)
+            status['message'] = message
+            if changed or time.monotonic() - last_write >= STATUS_WRITE_INTERVAL:
+                self._write(status)
+                last_write = time.monotonic()
+        
+        def should_cancel() -> bool:
+            nonlocal cancelled
+            cancelled = cancelled or self._cancel_requested(status['job_id'])
+            return cancelled
+        
+        try:
+            success = train_model(update_progress, engine=status['engine'], projection=status['projection'],
+                                  should_cancel=should_cancel)
+            status['state'] = 'succeeded' if success else 'failed'
+            if not success:
+                status['error'] = status['message']
+        except TrainingCancelled:
+            status['state'] = 'cancelled'
+            status['message'] = "Training cancelled; finished images are kept for the next run"
+        except Exception as e:
+            status['state'] = 'failed'
+            status['error'] = str(e)
+        finally:
+            status['finished_at'] = time.time()
+            self._write(status)
+            if os.path.exists(self.cancel_path):
+                os.remove(self.cancel_path)
+            os.close(fd)
+    
+    def _cancel_requested(self, job_id: str) -> bool:
+        try:
+            with open(self.cancel_path) as f:
+                return f.read().strip() == job_id
+        except FileNotFoundError:
+            return False
+    
+    def cancel(self, job_id: Optional[str] = None) -> bool:
+        """Ask the running job (or job_id, if given) to stop"""
+        with self._lock:
+            status = self.status()
+            if not status['running'] or (job_id and status['job_id'] != job_id):
+                return False
+            with open(self.cancel_path, 'w') as f:
+                f.write(status['job_id'])
+            return True
+    
+    def status(self) -> dict:
+        """Latest status of the current or last job, from any process"""
+        status = self._read()
+        if status.get('state') in ACTIVE_STATES and not self._lock_held():
+            status['state'] = 'interrupted'
+            status['message'] = "Training stopped unexpectedly; finished images are kept for the next run"
+        status['running'] = status.get('state') in ACTIVE_STATES
+        status['cancel_requested'] = status['running'] and self._cancel_requested(status['job_id'])
+        return status
+    
+    def wait(self, timeout: Optional[float] = None) -> dict:
+        """Block until the job started by this manager finishes"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.status()
+
+_manager: Optional[TrainingJobManager] = None
+_manager_lock = threading.Lock()
+
+def training_manager() -> TrainingJobManager:
+    """The process-wide training job manager"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = TrainingJobManager()
+        return _manager